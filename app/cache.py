@@ -1,3 +0,0 @@
-from cachetools import TTLCache
-
-cache = TTLCache(maxsize=100, ttl=600)
@@ -0,0 +1,37 @@
+from redis.asyncio import Redis
+
+from app.config import settings
+from .backends import CacheBackend, MemoryCacheBackend, RedisCacheBackend, TieredCacheBackend
+
+
+def create_cache_backend() -> CacheBackend:
+    """Creates the cache backend selected by CACHE_BACKEND."""
+
+    if settings.CACHE_BACKEND == 'memory':
+        return MemoryCacheBackend(maxsize=settings.CACHE_MAXSIZE, ttl=settings.CACHE_TTL)
+
+    l2 = RedisCacheBackend(
+        redis=Redis.from_url(settings.REDIS_URL),
+        ttl=settings.CACHE_TTL,
+        prefix=settings.CACHE_KEY_PREFIX,
+    )
+    if settings.CACHE_BACKEND == 'redis':
+        return l2
+
+    return TieredCacheBackend(
+        l1=MemoryCacheBackend(maxsize=settings.CACHE_MAXSIZE, ttl=settings.CACHE_L1_TTL),
+        l2=l2,
+        channel=settings.CACHE_KEY_PREFIX + 'invalidate',
+    )
+
+
+cache = create_cache_backend()
+
+__all__ = [
+    'CacheBackend',
+    'MemoryCacheBackend',
+    'RedisCacheBackend',
+    'TieredCacheBackend',
+    'cache',
+    'create_cache_backend',
+]
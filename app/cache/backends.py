@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from cachetools import TLRUCache
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """
+    Interface of a key-value cache storing serialized values.
+
+    Values are bytes so that every backend, including shared ones,
+    can store them as-is.
+    """
+
+    async def start(self) -> None:
+        """Starts background work of the backend, if it has any."""
+
+    async def close(self) -> None:
+        """Releases resources held by the backend."""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        ...
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, items: dict[str, bytes], ttl: float | None = None) -> None:
+        for key, value in items.items():
+            await self.set(key, value, ttl)
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU cache with per-entry TTL.
+
+    Entries are not shared between workers, so this backend is only
+    safe to use with a single worker process.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.ttl = ttl
+        self._cache = TLRUCache(maxsize=maxsize, ttu=self._expires_at, timer=time.monotonic)
+
+    @staticmethod
+    def _expires_at(_key: str, value: tuple[bytes, float], _now: float) -> float:
+        return value[1]
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._cache.get(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        self.set_local(key, value, ttl)
+
+    async def delete(self, *keys: str) -> None:
+        self.delete_local(*keys)
+
+    async def clear(self) -> None:
+        self._cache.clear()
+
+    def set_local(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            self._cache.pop(key, None)
+            return
+        self._cache[key] = (value, time.monotonic() + ttl)
+
+    def delete_local(self, *keys: str) -> None:
+        for key in keys:
+            self._cache.pop(key, None)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared by all workers, stored in Redis or any Redis-compatible server."""
+
+    def __init__(self, redis: Redis, ttl: float, prefix: str) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.redis.get(self._key(key))
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+        return await self.redis.mget([self._key(key) for key in keys])
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, float | None]:
+        """Returns the value together with its remaining time to live in seconds."""
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            value, pttl = await pipe.get(self._key(key)).pttl(self._key(key)).execute()
+        return value, (pttl / 1000 if pttl > 0 else None)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            await self.delete(key)
+            return
+        await self.redis.set(self._key(key), value, px=int(ttl * 1000))
+
+    async def set_many(self, items: dict[str, bytes], ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if not items:
+            return
+        if ttl <= 0:
+            await self.delete(*items)
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self._key(key), value, px=int(ttl * 1000))
+            await pipe.execute()
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.redis.delete(*(self._key(key) for key in keys))
+
+    async def clear(self) -> None:
+        async for key in self.redis.scan_iter(match=self.prefix + '*', count=1000):
+            await self.redis.delete(key)
+
+
+class TieredCacheBackend(CacheBackend):
+    """
+    Two-tier cache: a small in-process L1 in front of a shared L2.
+
+    Every write and delete is published on a Redis channel, and each worker
+    evicts the key from its own L1 when it receives the message. Pub/sub
+    delivery is best effort, so the L1 TTL bounds how stale a missed
+    invalidation can make an entry.
+    """
+
+    def __init__(self, l1: MemoryCacheBackend, l2: RedisCacheBackend, channel: str) -> None:
+        self.l1 = l1
+        self.l2 = l2
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex
+        self._listener: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self.l2.close()
+
+    async def get(self, key: str) -> bytes | None:
+        value = await self.l1.get(key)
+        if value is not None:
+            return value
+
+        value, ttl = await self.l2.get_with_ttl(key)
+        if value is not None:
+            self.l1.set_local(key, value, min(self.l1.ttl, ttl) if ttl else None)
+        return value
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        values = [await self.l1.get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        if missing:
+            # Values read in bulk are kept in L1 for the default L1 TTL only.
+            l2_values = await self.l2.get_many([keys[index] for index in missing])
+            for index, value in zip(missing, l2_values):
+                if value is not None:
+                    values[index] = value
+                    self.l1.set_local(keys[index], value)
+        return values
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await self.l2.set(key, value, ttl)
+        await self._publish(key)
+        self.l1.set_local(key, value, min(self.l1.ttl, ttl) if ttl is not None else None)
+
+    async def set_many(self, items: dict[str, bytes], ttl: float | None = None) -> None:
+        await self.l2.set_many(items, ttl)
+        await self._publish(*items)
+        for key, value in items.items():
+            self.l1.set_local(key, value, min(self.l1.ttl, ttl) if ttl is not None else None)
+
+    async def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        await self.l2.delete(*keys)
+        self.l1.delete_local(*keys)
+        await self._publish(*keys)
+
+    async def clear(self) -> None:
+        await self.l2.clear()
+        await self.l1.clear()
+        await self._publish('*')
+
+    async def _publish(self, *keys: str) -> None:
+        if not keys:
+            return
+        async with self.l2.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.publish(self.channel, f'{self.instance_id} {key}')
+            await pipe.execute()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.l2.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Anything published while we were not subscribed is lost.
+                    await self.l1.clear()
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        sender, _, key = message['data'].decode().partition(' ')
+                        if sender == self.instance_id:
+                            continue
+                        if key == '*':
+                            await self.l1.clear()
+                        else:
+                            self.l1.delete_local(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Cache invalidation listener failed, resubscribing')
+                await asyncio.sleep(1)
@@ -0,0 +1,116 @@
+"""
+Picks password hashing costs that make one hash take about a target time on this host.
+
+Run it on a host like the ones serving logins, while it is otherwise idle, and
+put the printed settings into the .env file. bcrypt rounds are picked for the
+bcrypt scheme. For argon2 the memory cost and parallelism are kept, and the
+time cost is picked.
+
+Usage example:
+    python -m app.cli.calibrate_password_hashing --scheme bcrypt --target-ms 250
+    python -m app.cli.calibrate_password_hashing --scheme argon2 --target-ms 250 --memory-cost 65536
+"""
+import argparse
+import logging
+import statistics
+import time
+from typing import Literal
+
+from passlib.hash import argon2, bcrypt
+from passlib.utils.handlers import GenericHandler
+
+from app.config import settings
+
+logger = logging.getLogger('calibrate_password_hashing')
+
+CALIBRATION_PASSWORD = 'calibration-Passw0rd!'
+
+# Costs above these take far longer than any sensible target.
+MAX_BCRYPT_ROUNDS = 20
+MAX_ARGON2_TIME_COST = 50
+
+
+def measure(handler: type[GenericHandler], samples: int) -> float:
+    """Returns the median time in seconds to hash a password with the handler."""
+
+    durations = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.hash(CALIBRATION_PASSWORD)
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def calibrate_bcrypt(target: float, samples: int) -> dict[str, object]:
+    best_rounds = bcrypt.min_rounds
+    for rounds in range(bcrypt.min_rounds, MAX_BCRYPT_ROUNDS + 1):
+        duration = measure(bcrypt.using(rounds=rounds), samples)
+        logger.info('bcrypt rounds=%d: %.0f ms', rounds, duration * 1000)
+        if duration > target:
+            break
+        best_rounds = rounds
+
+    return {
+        'PASSWORD_HASH_SCHEMES': '["bcrypt"]',
+        'PASSWORD_BCRYPT_ROUNDS': best_rounds,
+    }
+
+
+def calibrate_argon2(target: float, samples: int, memory_cost: int, parallelism: int) -> dict[str, object]:
+    if not argon2.has_backend():
+        raise SystemExit('argon2 password hashing needs argon2-cffi: pip install argon2-cffi')
+
+    best_time_cost = 1
+    for time_cost in range(1, MAX_ARGON2_TIME_COST + 1):
+        handler = argon2.using(rounds=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        duration = measure(handler, samples)
+        logger.info('argon2 time_cost=%d: %.0f ms', time_cost, duration * 1000)
+        if duration > target:
+            if time_cost == 1:
+                logger.warning('Even time_cost=1 is slower than the target, consider a lower --memory-cost')
+            break
+        best_time_cost = time_cost
+
+    return {
+        # bcrypt stays accepted, so existing hashes are upgraded on login.
+        'PASSWORD_HASH_SCHEMES': '["argon2", "bcrypt"]',
+        'PASSWORD_ARGON2_TIME_COST': best_time_cost,
+        'PASSWORD_ARGON2_MEMORY_COST': memory_cost,
+        'PASSWORD_ARGON2_PARALLELISM': parallelism,
+    }
+
+
+def calibrate(
+        scheme: Literal['bcrypt', 'argon2'],
+        target: float,
+        samples: int,
+        memory_cost: int,
+        parallelism: int,
+) -> dict[str, object]:
+    """Returns the settings that make one hash of the scheme take at most `target` seconds."""
+
+    if scheme == 'bcrypt':
+        return calibrate_bcrypt(target, samples)
+    return calibrate_argon2(target, samples, memory_cost, parallelism)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Pick password hashing costs for a target hash time.')
+    parser.add_argument('--scheme', choices=['bcrypt', 'argon2'], default=settings.PASSWORD_HASH_SCHEMES[0])
+    parser.add_argument('--target-ms', type=float, default=250, help='Target time of one hash in milliseconds')
+    parser.add_argument('--samples', type=int, default=5, help='Hashes timed per cost')
+    parser.add_argument('--memory-cost', type=int, default=settings.PASSWORD_ARGON2_MEMORY_COST,
+                        help='argon2 memory cost in KiB')
+    parser.add_argument('--parallelism', type=int, default=settings.PASSWORD_ARGON2_PARALLELISM,
+                        help='argon2 parallelism')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    calibrated = calibrate(args.scheme, args.target_ms / 1000, args.samples, args.memory_cost, args.parallelism)
+    for name, value in calibrated.items():
+        print(f'{name}={value}')
+
+
+if __name__ == '__main__':
+    main()
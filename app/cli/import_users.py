@@ -0,0 +1,280 @@
+"""
+Bulk import of users from a CSV or NDJSON file.
+
+Records need an `email`, either a plain `password` or an existing bcrypt
+`password_hash`, and optionally the `referral_code` of the referring user.
+
+Plain passwords are hashed in a process pool while the previous chunk is being
+loaded, referral codes are resolved once per chunk, and rows are loaded with
+COPY into a staging table followed by INSERT ... ON CONFLICT DO NOTHING, so
+emails that already exist are skipped. Referral counters of the referrers and,
+when enabled, the referral closure table are updated by the same statement.
+After every chunk the number of processed records is saved to a checkpoint
+file, and `--resume` continues from there.
+
+Usage example:
+    python -m app.cli.import_users users.csv --checkpoint users.checkpoint.json --resume
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+
+import asyncpg
+from pydantic import ValidationError
+from sqlalchemy import make_url
+
+from app.config import settings
+from app.database import DATABASE_URL
+from app.schemas import UserImportSchema
+from app.utils.security import hash_passwords
+
+logger = logging.getLogger('import_users')
+
+HASH_BATCH_SIZE = 64
+
+CREATE_STAGING_TABLE = '''
+    CREATE TEMPORARY TABLE IF NOT EXISTS import_users (
+        email varchar NOT NULL,
+        password_hash varchar NOT NULL,
+        referred_by integer,
+        created_at timestamptz NOT NULL
+    ) ON COMMIT DELETE ROWS
+'''
+
+# Inserts the staged users and counts the inserted ones in the referral counters of their referrers.
+INSERT_FROM_STAGING = '''
+    WITH inserted AS (
+        INSERT INTO users (email, password_hash, referred_by, created_at)
+        SELECT email, password_hash, referred_by, created_at FROM import_users
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id, referred_by, created_at
+    ), referrals AS (
+        SELECT referred_by, (created_at AT TIME ZONE 'UTC')::date AS day, count(*) AS count, max(created_at) AS last_at
+        FROM inserted
+        WHERE referred_by IS NOT NULL
+        GROUP BY 1, 2
+    ), counters AS (
+        UPDATE users
+        SET referrals_count = users.referrals_count + totals.count,
+            last_referral_at = GREATEST(users.last_referral_at, totals.last_at)
+        FROM (
+            SELECT referred_by, sum(count) AS count, max(last_at) AS last_at FROM referrals GROUP BY referred_by
+        ) AS totals
+        WHERE users.id = totals.referred_by
+    ), daily_stats AS (
+        INSERT INTO referral_daily_stats (referrer_id, day, count)
+        SELECT referred_by, day, count FROM referrals
+        ON CONFLICT (referrer_id, day) DO UPDATE SET count = referral_daily_stats.count + excluded.count
+    ){closure}
+    SELECT count(*) FROM inserted
+'''
+
+# Links the inserted users to their referrers and to all of the referrers' ancestors.
+CLOSURE_FROM_INSERTED = ''', closure AS (
+        INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+        SELECT referred_by, id, 1 FROM inserted WHERE referred_by IS NOT NULL
+        UNION ALL
+        SELECT referral_closure.ancestor_id, inserted.id, referral_closure.depth + 1
+        FROM inserted JOIN referral_closure ON referral_closure.descendant_id = inserted.referred_by
+    )'''
+
+SELECT_REFERRAL_CODES = '''
+    SELECT code, user_id, expiry_date FROM referral_codes WHERE code = ANY($1::varchar[])
+'''
+
+
+@dataclass
+class ImportStats:
+    resumed_from: int = 0
+    processed: int = 0
+    inserted: int = 0
+    invalid: int = 0
+    unresolved_referrals: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def log_progress(self) -> None:
+        elapsed = time.monotonic() - self.started_at
+        processed_now = self.processed - self.resumed_from
+        logger.info(
+            'processed=%d inserted=%d skipped_existing=%d invalid=%d unresolved_referrals=%d rate=%.0f users/s',
+            self.processed, self.inserted, processed_now - self.inserted - self.invalid,
+            self.invalid, self.unresolved_referrals, processed_now / elapsed if elapsed else 0.0,
+        )
+
+
+def read_records(path: Path, file_format: str) -> Iterator[dict]:
+    """Yields raw records from a CSV file with a header row or from an NDJSON file."""
+
+    with path.open(newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_checkpoint(path: Path) -> int:
+    if not path.exists():
+        return 0
+    return json.loads(path.read_text())['processed']
+
+
+def write_checkpoint(path: Path, processed: int) -> None:
+    # Write and rename so an interrupted run never leaves a truncated checkpoint.
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    tmp_path.write_text(json.dumps({'processed': processed}))
+    tmp_path.replace(path)
+
+
+async def hash_chunk(executor: ProcessPoolExecutor, users: list[UserImportSchema]) -> list[str]:
+    """Returns the password hash of every user, hashing plain passwords in the process pool."""
+
+    loop = asyncio.get_running_loop()
+    passwords = [user.password for user in users if not user.password_hash]
+    batches = [passwords[i:i + HASH_BATCH_SIZE] for i in range(0, len(passwords), HASH_BATCH_SIZE)]
+    hashed_batches = await asyncio.gather(*(
+        loop.run_in_executor(executor, hash_passwords, batch) for batch in batches
+    ))
+    hashed = iter(password_hash for batch in hashed_batches for password_hash in batch)
+    return [user.password_hash or next(hashed) for user in users]
+
+
+async def resolve_referrers(connection: asyncpg.Connection, users: list[UserImportSchema]) -> dict[str, int]:
+    """Maps every active referral code used in the chunk to the id of its owner."""
+
+    codes = list({user.referral_code for user in users if user.referral_code})
+    if not codes:
+        return {}
+
+    now = datetime.now(timezone.utc)
+    rows = await connection.fetch(SELECT_REFERRAL_CODES, codes)
+    return {row['code']: row['user_id'] for row in rows if row['expiry_date'] > now}
+
+
+async def load_chunk(
+        connection: asyncpg.Connection,
+        users: list[UserImportSchema],
+        password_hashes: list[str],
+        stats: ImportStats,
+) -> None:
+    referrers = await resolve_referrers(connection, users)
+    created_at = datetime.now(timezone.utc)
+
+    records = []
+    for user, password_hash in zip(users, password_hashes):
+        referred_by = referrers.get(user.referral_code) if user.referral_code else None
+        if user.referral_code and referred_by is None:
+            stats.unresolved_referrals += 1
+        records.append((user.email, password_hash, referred_by, created_at))
+
+    async with connection.transaction():
+        await connection.execute(CREATE_STAGING_TABLE)
+        await connection.copy_records_to_table(
+            'import_users',
+            records=records,
+            columns=['email', 'password_hash', 'referred_by', 'created_at'],
+        )
+        inserted = await connection.fetchval(INSERT_FROM_STAGING.format(
+            closure=CLOSURE_FROM_INSERTED if settings.REFERRAL_CLOSURE_ENABLED else ''
+        ))
+
+    stats.inserted += inserted
+
+
+def parse_chunk(raw_records: list[dict], first_index: int) -> list[UserImportSchema]:
+    users = []
+    for index, raw_record in enumerate(raw_records, start=first_index):
+        try:
+            users.append(UserImportSchema.model_validate(raw_record))
+        except ValidationError as error:
+            logger.warning('Skipping record %d: %s', index + 1, error.errors()[0]['msg'])
+    return users
+
+
+async def import_users(
+        path: Path,
+        file_format: str,
+        chunk_size: int,
+        workers: int | None,
+        checkpoint_path: Path,
+        resume: bool,
+) -> ImportStats:
+    skip = read_checkpoint(checkpoint_path) if resume else 0
+    records = read_records(path, file_format)
+    if skip:
+        logger.info('Resuming after %d records', skip)
+        records = islice(records, skip, None)
+
+    stats = ImportStats(resumed_from=skip, processed=skip)
+    dsn = make_url(DATABASE_URL).set(drivername='postgresql').render_as_string(hide_password=False)
+    connection = await asyncpg.connect(dsn)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            async def prepare(raw_records: list[dict], first_index: int):
+                users = parse_chunk(raw_records, first_index)
+                return raw_records, users, await hash_chunk(executor, users)
+
+            raw_chunk = list(islice(records, chunk_size))
+            pending = asyncio.create_task(prepare(raw_chunk, stats.processed)) if raw_chunk else None
+
+            while pending:
+                raw_chunk, users, password_hashes = await pending
+
+                # Hash the next chunk while the current one is being loaded.
+                next_raw_chunk = list(islice(records, chunk_size))
+                next_first_index = stats.processed + len(raw_chunk)
+                pending = asyncio.create_task(prepare(next_raw_chunk, next_first_index)) if next_raw_chunk else None
+
+                if users:
+                    await load_chunk(connection, users, password_hashes, stats)
+
+                stats.processed += len(raw_chunk)
+                stats.invalid += len(raw_chunk) - len(users)
+                write_checkpoint(checkpoint_path, stats.processed)
+                stats.log_progress()
+    finally:
+        await connection.close()
+
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Import users from a CSV or NDJSON file.')
+    parser.add_argument('path', type=Path, help='File with the users to import')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='Input format, detected from the extension by default')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Number of records loaded per COPY')
+    parser.add_argument('--workers', type=int, default=None, help='Number of hashing processes, defaults to the CPU count')
+    parser.add_argument('--checkpoint', type=Path, help='Checkpoint file, defaults to <path>.checkpoint.json')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    file_format = args.format or ('ndjson' if args.path.suffix in ('.ndjson', '.jsonl') else 'csv')
+    checkpoint_path = args.checkpoint or args.path.with_name(args.path.name + '.checkpoint.json')
+
+    stats = asyncio.run(import_users(
+        path=args.path,
+        file_format=file_format,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        checkpoint_path=checkpoint_path,
+        resume=args.resume,
+    ))
+    logger.info('Import finished')
+    stats.log_progress()
+
+
+if __name__ == '__main__':
+    main()
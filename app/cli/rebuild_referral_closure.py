@@ -0,0 +1,32 @@
+"""
+Rebuilds the referral_closure table from `users.referred_by`.
+
+Run it after enabling REFERRAL_CLOSURE_ENABLED on a database where signups
+happened while it was disabled.
+
+Usage example:
+    python -m app.cli.rebuild_referral_closure
+"""
+import asyncio
+import logging
+
+from app.database import AsyncSessionLocal
+from app.database.crud.referral_tree import rebuild_referral_closure
+
+logger = logging.getLogger('rebuild_referral_closure')
+
+
+async def rebuild() -> int:
+    async with AsyncSessionLocal() as db:
+        return await rebuild_referral_closure(db)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    pairs = asyncio.run(rebuild())
+    logger.info('Referral closure rebuilt with %d pairs', pairs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,15 @@
 from .base import Base
-from .session import AsyncSessionLocal, DATABASE_URL
-from .depends import get_db
+from .session import AsyncSessionLocal, ReadSessionLocal, DATABASE_URL, engine, replica_engines
+from .depends import get_db, get_read_db, read_from_primary
 
 __all__ = [
     'Base',
     'AsyncSessionLocal',
+    'ReadSessionLocal',
     'DATABASE_URL',
+    'engine',
+    'replica_engines',
     'get_db',
+    'get_read_db',
+    'read_from_primary',
 ]
\ No newline at end of file
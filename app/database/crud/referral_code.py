@@ -1,7 +1,11 @@
-from sqlalchemy import select
+from datetime import datetime, timezone
+from typing import Sequence
+
+from sqlalchemy import String, any_, bindparam, delete, insert, select
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.models import ReferralCode
+from app.database.models import ReferralCode, ArchivedReferralCode, User
 from app.schemas import ReferralCodeCreateSchema
 
 
@@ -28,6 +32,13 @@ async def get_referral_code_by_id(
     return await db.get(ReferralCode, referral_code_id)
 
 
+async def get_referral_code_by_code(
+        db: AsyncSession,
+        code: str,
+) -> ReferralCode | None:
+    return await db.scalar(select(ReferralCode).where(ReferralCode.code == code))
+
+
 async def get_referral_code_by_user_id(
         db: AsyncSession,
         user_id: int,
@@ -35,6 +46,59 @@ async def get_referral_code_by_user_id(
     return await db.scalar(select(ReferralCode).where(ReferralCode.user_id == user_id))
 
 
+async def get_referral_code_by_user_email(
+        db: AsyncSession,
+        email: str,
+) -> ReferralCode | None:
+    return await db.scalar(
+        select(ReferralCode)
+        .join(User, User.id == ReferralCode.user_id)
+        .where(User.email == email, ReferralCode.expiry_date > datetime.now(timezone.utc))
+    )
+
+
+async def get_referral_codes_by_user_emails(
+        db: AsyncSession,
+        emails: list[str],
+) -> Sequence[tuple[str, ReferralCode]]:
+    # A single array parameter keeps one prepared statement for any number of emails.
+    result = await db.execute(
+        select(User.email, ReferralCode)
+        .join(ReferralCode, ReferralCode.user_id == User.id)
+        .where(
+            User.email == any_(bindparam('emails', emails, type_=ARRAY(String))),
+            ReferralCode.expiry_date > datetime.now(timezone.utc),
+        )
+    )
+    return result.tuples().all()
+
+
+async def get_recently_used_referral_codes(
+        db: AsyncSession,
+        limit: int,
+) -> Sequence[tuple[str, ReferralCode]]:
+    result = await db.execute(
+        select(User.email, ReferralCode)
+        .join(ReferralCode, ReferralCode.user_id == User.id)
+        .where(User.last_referral_at.is_not(None), ReferralCode.expiry_date > datetime.now(timezone.utc))
+        .order_by(User.last_referral_at.desc())
+        .limit(limit)
+    )
+    return result.tuples().all()
+
+
+async def get_active_referral_codes(
+        db: AsyncSession,
+        created_since: datetime | None = None,
+) -> Sequence[ReferralCode]:
+    query = select(ReferralCode).where(ReferralCode.expiry_date > datetime.now(timezone.utc))
+    if created_since is not None:
+        query = query.where(ReferralCode.created_at >= created_since)
+
+    referral_codes = await db.scalars(query)
+    return referral_codes.all()
+
+
 async def delete_referral_code(
         db: AsyncSession,
         referral_code_id: int,
@@ -47,3 +111,42 @@ async def delete_referral_code(
         return True
 
     return False
+
+
+async def delete_expired_referral_codes(
+        db: AsyncSession,
+        batch_size: int,
+        archive: bool = False,
+) -> Sequence[str]:
+    """
+    Deletes up to `batch_size` expired codes, oldest expiry first, and returns them.
+
+    Rows locked by a concurrent sweep are skipped. With `archive`, the deleted
+    rows are copied to the archive table in the same statement.
+    """
+
+    expired_ids = (
+        select(ReferralCode.id)
+        .where(ReferralCode.expiry_date <= datetime.now(timezone.utc))
+        .order_by(ReferralCode.expiry_date)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    expired = delete(ReferralCode).where(ReferralCode.id.in_(expired_ids.scalar_subquery()))
+
+    if archive:
+        expired = expired.returning(
+            ReferralCode.id, ReferralCode.code, ReferralCode.user_id, ReferralCode.expiry_date
+        ).cte('expired')
+        query = (
+            insert(ArchivedReferralCode)
+            .from_select(['id', 'code', 'user_id', 'expiry_date'], select(expired))
+            .returning(ArchivedReferralCode.code)
+        )
+    else:
+        query = expired.returning(ReferralCode.code)
+
+    expired_codes = await db.scalars(query)
+    codes = expired_codes.all()
+    await db.commit()
+    return codes
@@ -0,0 +1,63 @@
+from sqlalchemy import String, bindparam, delete, exists, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import PooledReferralCode, ReferralCode
+
+
+async def claim_pooled_referral_code(db: AsyncSession) -> str | None:
+    """
+    Removes one code from the pool and returns it, without committing.
+
+    Rows locked by concurrent claims are skipped, so claims never wait for each other.
+    If the transaction is rolled back, the code goes back to the pool.
+    """
+
+    claimable = (
+        select(PooledReferralCode.code)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return await db.scalar(
+        delete(PooledReferralCode)
+        .where(PooledReferralCode.code == claimable)
+        .returning(PooledReferralCode.code)
+    )
+
+
+async def discard_pooled_referral_code(
+        db: AsyncSession,
+        code: str,
+) -> None:
+    """Removes a code taken by a user from the pool, without committing."""
+
+    await db.execute(delete(PooledReferralCode).where(PooledReferralCode.code == code))
+
+
+async def count_pooled_referral_codes(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count()).select_from(PooledReferralCode))
+
+
+async def add_pooled_referral_codes(
+        db: AsyncSession,
+        codes: list[str],
+) -> int:
+    """Adds the codes that are neither pooled nor taken yet, commits, and returns how many were added."""
+
+    candidates = (
+        func.unnest(bindparam('codes', codes, type_=ARRAY(String)))
+        .table_valued('code')
+        .render_derived('candidates')
+    )
+    result = await db.execute(
+        insert(PooledReferralCode)
+        .from_select(
+            ['code'],
+            select(candidates.c.code)
+            .where(~exists().where(ReferralCode.code == candidates.c.code))
+        )
+        .on_conflict_do_nothing()
+    )
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,74 @@
+from datetime import date, datetime, timezone
+from typing import Sequence
+
+from sqlalchemy import Integer, Row, any_, bindparam, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import User, ReferralDailyStats
+
+
+async def increment_referral_counters(
+        db: AsyncSession,
+        referrer_id: int,
+        referred_at: datetime,
+) -> None:
+    """Counts a new referral in the referrer's totals and daily bucket, without committing."""
+
+    await db.execute(
+        update(User)
+        .where(User.id == referrer_id)
+        .values(referrals_count=User.referrals_count + 1, last_referral_at=referred_at)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        insert(ReferralDailyStats)
+        .values(referrer_id=referrer_id, day=referred_at.astimezone(timezone.utc).date(), count=1)
+        .on_conflict_do_update(
+            index_elements=[ReferralDailyStats.referrer_id, ReferralDailyStats.day],
+            set_={'count': ReferralDailyStats.count + 1},
+        )
+    )
+
+
+async def get_referral_daily_stats(
+        db: AsyncSession,
+        referrer_id: int,
+        since: date,
+) -> Sequence[ReferralDailyStats]:
+    daily_stats = await db.scalars(
+        select(ReferralDailyStats)
+        .where(ReferralDailyStats.referrer_id == referrer_id, ReferralDailyStats.day >= since)
+    )
+    return daily_stats.all()
+
+
+async def get_referrer_totals(
+        db: AsyncSession,
+        changed_since: datetime | None = None,
+) -> Sequence[Row[tuple[int, int]]]:
+    """Returns `(id, referrals_count)` of every referrer, or of the ones with referrals after `changed_since`."""
+
+    query = select(User.id, User.referrals_count)
+    if changed_since:
+        query = query.where(User.last_referral_at >= changed_since)
+    else:
+        query = query.where(User.last_referral_at.is_not(None))
+
+    referrer_totals = await db.execute(query)
+    return referrer_totals.all()
+
+
+async def get_daily_stats_since(
+        db: AsyncSession,
+        since: date,
+        referrer_ids: list[int] | None = None,
+) -> Sequence[ReferralDailyStats]:
+    query = select(ReferralDailyStats).where(ReferralDailyStats.day >= since)
+    if referrer_ids is not None:
+        query = query.where(
+            ReferralDailyStats.referrer_id == any_(bindparam('referrer_ids', referrer_ids, type_=ARRAY(Integer)))
+        )
+
+    daily_stats = await db.scalars(query)
+    return daily_stats.all()
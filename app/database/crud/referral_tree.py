@@ -0,0 +1,152 @@
+from typing import Sequence
+
+from sqlalchemy import Integer, Row, delete, func, insert, literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.database.models import User, ReferralClosure
+
+
+def _downline(ancestor_id: int, max_depth: int, use_closure: bool):
+    """
+    Returns a selectable of `(id, depth)` for every user up to `max_depth` levels below the ancestor.
+
+    Without the closure table the tree is walked with a recursive CTE, one level per iteration.
+    """
+
+    if use_closure:
+        return (
+            select(ReferralClosure.descendant_id.label('id'), ReferralClosure.depth)
+            .where(ReferralClosure.ancestor_id == ancestor_id, ReferralClosure.depth <= max_depth)
+            .subquery('downline')
+        )
+
+    downline = (
+        select(User.id, literal(1, Integer).label('depth'))
+        .where(User.referred_by == ancestor_id)
+        .cte('downline', recursive=True)
+    )
+    referral = aliased(User)
+    return downline.union_all(
+        select(referral.id, downline.c.depth + 1)
+        .join(downline, referral.referred_by == downline.c.id)
+        .where(downline.c.depth < max_depth)
+    )
+
+
+def _upline(descendant_id: int, max_depth: int, use_closure: bool):
+    """Returns a selectable of `(id, depth)` for every referrer up to `max_depth` levels above the user."""
+
+    if use_closure:
+        return (
+            select(ReferralClosure.ancestor_id.label('id'), ReferralClosure.depth)
+            .where(ReferralClosure.descendant_id == descendant_id, ReferralClosure.depth <= max_depth)
+            .subquery('upline')
+        )
+
+    upline = (
+        select(User.referred_by.label('id'), literal(1, Integer).label('depth'))
+        .where(User.id == descendant_id, User.referred_by.is_not(None))
+        .cte('upline', recursive=True)
+    )
+    referrer = aliased(User)
+    return upline.union_all(
+        select(referrer.referred_by, upline.c.depth + 1)
+        .join(upline, referrer.id == upline.c.id)
+        .where(referrer.referred_by.is_not(None), upline.c.depth < max_depth)
+    )
+
+
+async def get_downline(
+        db: AsyncSession,
+        ancestor_id: int,
+        max_depth: int,
+        limit: int,
+        after: tuple[int, int] | None = None,
+        use_closure: bool = False,
+) -> Sequence[Row[tuple[User, int]]]:
+    downline = _downline(ancestor_id, max_depth, use_closure)
+    query = (
+        select(User, downline.c.depth)
+        .join(downline, User.id == downline.c.id)
+        .order_by(downline.c.depth, downline.c.id)
+        .limit(limit)
+    )
+    if after:
+        query = query.where(tuple_(downline.c.depth, downline.c.id) > tuple_(*after))
+
+    downline_query = await db.execute(query)
+    return downline_query.all()
+
+
+async def get_downline_level_counts(
+        db: AsyncSession,
+        ancestor_id: int,
+        max_depth: int,
+        use_closure: bool = False,
+) -> Sequence[Row[tuple[int, int]]]:
+    downline = _downline(ancestor_id, max_depth, use_closure)
+    level_counts = await db.execute(
+        select(downline.c.depth, func.count())
+        .group_by(downline.c.depth)
+        .order_by(downline.c.depth)
+    )
+    return level_counts.all()
+
+
+async def get_upline(
+        db: AsyncSession,
+        descendant_id: int,
+        max_depth: int,
+        use_closure: bool = False,
+) -> Sequence[Row[tuple[User, int]]]:
+    upline = _upline(descendant_id, max_depth, use_closure)
+    upline_query = await db.execute(
+        select(User, upline.c.depth)
+        .join(upline, User.id == upline.c.id)
+        .order_by(upline.c.depth)
+    )
+    return upline_query.all()
+
+
+async def add_referral_closure(
+        db: AsyncSession,
+        referrer_id: int,
+        user_id: int,
+) -> None:
+    """Links a new user to the referrer and to all of the referrer's ancestors, without committing."""
+
+    await db.execute(
+        insert(ReferralClosure)
+        .from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(literal(referrer_id, Integer), literal(user_id, Integer), literal(1, Integer))
+            .union_all(
+                select(ReferralClosure.ancestor_id, literal(user_id, Integer), ReferralClosure.depth + 1)
+                .where(ReferralClosure.descendant_id == referrer_id)
+            )
+        )
+    )
+
+
+async def rebuild_referral_closure(db: AsyncSession) -> int:
+    """Recreates the whole closure table from `users.referred_by` and returns the number of pairs."""
+
+    closure = (
+        select(User.referred_by.label('ancestor_id'), User.id.label('descendant_id'), literal(1, Integer).label('depth'))
+        .where(User.referred_by.is_not(None))
+        .cte('closure', recursive=True)
+    )
+    referral = aliased(User)
+    closure = closure.union_all(
+        select(closure.c.ancestor_id, referral.id, closure.c.depth + 1)
+        .join(closure, referral.referred_by == closure.c.descendant_id)
+    )
+
+    await db.execute(delete(ReferralClosure))
+    result = await db.execute(
+        insert(ReferralClosure)
+        .from_select(['ancestor_id', 'descendant_id', 'depth'], select(closure))
+    )
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from typing import Sequence
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import RevokedToken
+
+
+async def create_revoked_token(
+        db: AsyncSession,
+        jti: str,
+        expires_at: datetime,
+        user_id: int | None = None,
+) -> bool:
+    """Revokes the id and returns False if it had already been revoked."""
+
+    revoked_id = await db.scalar(
+        insert(RevokedToken)
+        .values(jti=jti, user_id=user_id, expires_at=expires_at)
+        .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+        .returning(RevokedToken.id)
+    )
+    await db.commit()
+    return revoked_id is not None
+
+
+async def get_revoked_tokens(
+        db: AsyncSession,
+        after_id: int = 0,
+) -> Sequence[RevokedToken]:
+    revoked_tokens = await db.scalars(
+        select(RevokedToken)
+        .where(RevokedToken.id > after_id, RevokedToken.expires_at > datetime.now(timezone.utc))
+        .order_by(RevokedToken.id)
+    )
+    return revoked_tokens.all()
+
+
+async def delete_expired_revoked_tokens(db: AsyncSession) -> None:
+    await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.now(timezone.utc)))
+    await db.commit()
@@ -1,28 +1,36 @@
-from typing import Sequence
+from datetime import datetime
+from typing import AsyncIterator, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import insert, select, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.database.crud.referral_stats import increment_referral_counters
+from app.database.crud.referral_tree import add_referral_closure
 from app.database.models import User
 from app.schemas import UserCreateSchema
-from app.utils.security import hash_password
 
 
 async def create_user(
         db: AsyncSession,
         user_create_schema: UserCreateSchema,
+        password_hash: str,
         referred_by: int | None = None,
+        with_closure: bool = False,
 ) -> User:
-    password_hash = hash_password(user_create_schema.password)
-
-    user = User(
-        email=user_create_schema.email,
-        password_hash=password_hash,
-        referred_by=referred_by
+    user = await db.scalar(
+        insert(User)
+        .values(
+            email=user_create_schema.email,
+            password_hash=password_hash,
+            referred_by=referred_by,
+        )
+        .returning(User)
     )
-    db.add(user)
+    if referred_by is not None:
+        await increment_referral_counters(db, referred_by, user.created_at)
+        if with_closure:
+            await add_referral_closure(db, referred_by, user.id)
     await db.commit()
-    await db.refresh(user)
     return user
 
 
@@ -40,16 +48,47 @@ async def get_user_by_email(
     return await db.scalar(select(User).where(User.email == email))
 
 
-async def get_user_by_referral_code(
+async def update_user_password_hash(
         db: AsyncSession,
-        referral_code: str,
-) -> User | None:
-    return await db.scalar(select(User).where(User.referral_code.has(code=referral_code)))
+        user_id: int,
+        old_password_hash: str,
+        password_hash: str,
+) -> bool:
+    # The old hash guards against overwriting a password changed in the meantime.
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, User.password_hash == old_password_hash)
+        .values(password_hash=password_hash)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+def _referrals_query(referrer_id: int, after: tuple[datetime, int] | None):
+    query = select(User).where(User.referred_by == referrer_id).order_by(User.created_at, User.id)
+    if after:
+        query = query.where(tuple_(User.created_at, User.id) > tuple_(*after))
+    return query
 
 
 async def get_users_by_referrer_id(
         db: AsyncSession,
         referrer_id: int,
+        limit: int,
+        after: tuple[datetime, int] | None = None,
 ) -> Sequence[User]:
-    referrals_query = await db.scalars(select(User).where(User.referred_by == referrer_id))
+    referrals_query = await db.scalars(_referrals_query(referrer_id, after).limit(limit))
     return referrals_query.all()
+
+
+async def stream_users_by_referrer_id(
+        db: AsyncSession,
+        referrer_id: int,
+        after: tuple[datetime, int] | None = None,
+        batch_size: int = 1000,
+) -> AsyncIterator[Sequence[User]]:
+    referrals_stream = await db.stream_scalars(
+        _referrals_query(referrer_id, after).execution_options(yield_per=batch_size)
+    )
+    async for batch in referrals_stream.partitions():
+        yield batch
@@ -1,17 +1,122 @@
-from typing import AsyncGenerator
+import time
+from typing import Annotated, AsyncGenerator
 
+from fastapi import Depends, Request, Response
+from jose import JWTError, jwt
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import AsyncSessionLocal
+from app.cache import cache
+from app.config import settings
+from app.database import AsyncSessionLocal, ReadSessionLocal, replica_engines
 
+# Cookie telling read-only dependencies to use the primary until the given unix
+# time. Clients without a bearer token, e.g. right after signup, rely on it.
+PRIMARY_STICKY_COOKIE = 'db_primary_until'
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
+
+def _sticky_cache_key(user_id: str) -> str:
+    return f'db:primary_until:user:{user_id}'
+
+
+def _token_user_id(request: Request) -> str | None:
+    """
+    Returns the user ID from the bearer token of the request, without verifying the token.
+
+    It only decides which database serves the reads of the request, and
+    endpoints that act on behalf of the user verify the token themselves.
+    """
+
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    try:
+        user_id = jwt.get_unverified_claims(token).get('sub')
+    except JWTError:
+        return None
+    return str(user_id) if user_id is not None else None
+
+
+def _set_sticky_cookie(response: Response) -> None:
+    sticky_seconds = settings.DATABASE_REPLICA_STICKY_SECONDS
+    response.set_cookie(
+        PRIMARY_STICKY_COOKIE,
+        str(int(time.time()) + sticky_seconds),
+        max_age=sticky_seconds,
+        httponly=True,
+        samesite='lax',
+    )
+
+
+def _has_sticky_cookie(request: Request) -> bool:
+    sticky_until = request.cookies.get(PRIMARY_STICKY_COOKIE)
+    try:
+        return sticky_until is not None and int(sticky_until) > time.time()
+    except ValueError:
+        return False
+
+
+async def read_from_primary(request: Request) -> bool:
+    """
+    Dependency telling whether the reads of the request have to go to the primary.
+
+    That is the case for a short time after the user of the bearer token, or the
+    client holding the sticky cookie, committed a write, so they read their own
+    writes despite replication lag. The user's entry lives in the cache backend,
+    so with the `memory` backend it only applies to the worker that did the write.
+    """
+
+    if not replica_engines:
+        return False
+    if _has_sticky_cookie(request):
+        return True
+
+    user_id = _token_user_id(request)
+    return user_id is not None and await cache.get(_sticky_cache_key(user_id)) is not None
+
+
+async def get_db(request: Request, response: Response) -> AsyncGenerator[AsyncSession, None]:
     """
     Dependency that provides an asynchronous database session.
 
+    When read replicas are configured, a commit in this session makes the
+    client's following reads go to the primary for a short time.
+
     Yields:
        -  AsyncSession: An asynchronous session to interact with the database.
     """
 
+    committed = False
+
+    def on_commit(_session) -> None:
+        nonlocal committed
+        committed = True
+        _set_sticky_cookie(response)
+
     async with AsyncSessionLocal() as session:
+        if replica_engines:
+            event.listen(session.sync_session, 'after_commit', on_commit)
+        yield session
+
+    # Dependencies are closed before the response is sent, so the client cannot
+    # read before its user is marked.
+    user_id = _token_user_id(request) if committed else None
+    if user_id is not None:
+        await cache.set(_sticky_cache_key(user_id), b'1', ttl=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+async def get_read_db(
+        use_primary: Annotated[bool, Depends(read_from_primary)],
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency that provides an asynchronous database session for read-only work.
+
+    The session uses a read replica if any are configured, unless the client
+    wrote recently and has to read its own writes from the primary.
+
+    Yields:
+       -  AsyncSession: An asynchronous session to interact with the database.
+    """
+
+    async with ReadSessionLocal(use_primary=use_primary) as session:
         yield session
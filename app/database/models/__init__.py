@@ -1,7 +1,16 @@
 from .user import User
-from .referral_code import ReferralCode
+from .referral_code import ReferralCode, ArchivedReferralCode
+from .revoked_token import RevokedToken
+from .referral_stats import ReferralDailyStats
+from .referral_closure import ReferralClosure
+from .referral_code_pool import PooledReferralCode
 
 __all__ = [
     'User',
     'ReferralCode',
+    'ArchivedReferralCode',
+    'RevokedToken',
+    'ReferralDailyStats',
+    'ReferralClosure',
+    'PooledReferralCode',
 ]
\ No newline at end of file
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, ForeignKey, Index
+
+from app.database import Base
+
+
+class ReferralClosure(Base):
+    """
+    Every ancestor/descendant pair of the referral tree, with the number of levels between them.
+
+    A direct referral has depth 1. Users are not paired with themselves.
+    """
+
+    __tablename__ = 'referral_closure'
+    __table_args__ = (
+        Index('ix_referral_closure_ancestor_id_depth_descendant_id', 'ancestor_id', 'depth', 'descendant_id'),
+        Index('ix_referral_closure_descendant_id_depth', 'descendant_id', 'depth'),
+    )
+
+    ancestor_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    depth = Column(Integer, nullable=False)
@@ -9,10 +9,12 @@ from app.database import Base
 class ReferralCode(Base):
     __tablename__ = 'referral_codes'
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     code = Column(String, unique=True, index=True, nullable=False)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    expiry_date = Column(DateTime(timezone=True), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), unique=True, index=True, nullable=False)
+    expiry_date = Column(DateTime(timezone=True), index=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(tz=timezone.utc), index=True,
+                        nullable=False)
 
     user = relationship('User', back_populates='referral_code')
 
@@ -36,3 +38,15 @@ class ReferralCode(Base):
         """
 
         self.expiry_date = datetime.now(tz=timezone.utc)
+
+
+class ArchivedReferralCode(Base):
+    """Expired referral code moved out of `referral_codes` by the expiry sweeper."""
+
+    __tablename__ = 'referral_codes_archive'
+
+    id = Column(Integer, primary_key=True)
+    code = Column(String, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True, nullable=False)
+    expiry_date = Column(DateTime(timezone=True), nullable=False)
+    archived_at = Column(DateTime(timezone=True), default=lambda: datetime.now(tz=timezone.utc), nullable=False)
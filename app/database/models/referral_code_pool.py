@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String
+
+from app.database import Base
+
+
+class PooledReferralCode(Base):
+    """Pre-generated referral code that no user has claimed yet."""
+
+    __tablename__ = 'referral_code_pool'
+
+    code = Column(String, primary_key=True)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, ForeignKey, Date
+
+from app.database import Base
+
+
+class ReferralDailyStats(Base):
+    """Number of users a referrer brought in on a given UTC day."""
+
+    __tablename__ = 'referral_daily_stats'
+
+    referrer_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
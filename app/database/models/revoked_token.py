@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+
+from app.database import Base
+
+
+class RevokedToken(Base):
+    """
+    Revoked JWT id (`jti`) or token family id (`fam`).
+
+    Rows are kept until `expires_at`, after which every token
+    they could match has expired on its own.
+    """
+
+    __tablename__ = 'revoked_tokens'
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
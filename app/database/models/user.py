@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -8,12 +8,19 @@ from app.database import Base
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_referred_by_created_at_id', 'referred_by', 'created_at', 'id'),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
     referred_by = Column(Integer, ForeignKey('users.id'), nullable=True)
-    created_at = Column(DateTime(timezone=True), default=datetime.now(tz=timezone.utc))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(tz=timezone.utc))
+
+    # Maintained on signup, so referral totals never need a scan of users.
+    referrals_count = Column(Integer, nullable=False, default=0, server_default='0')
+    last_referral_at = Column(DateTime(timezone=True), index=True, nullable=True)
 
     referral_code = relationship('ReferralCode', uselist=False, back_populates='user')
     referrals = relationship('User', backref='referrer', remote_side=[id])
@@ -0,0 +1,114 @@
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, PoolProxiedConnection
+
+from app.utils.metrics import Counter, Histogram
+from app.utils.request_metrics import record_pool_wait, record_query
+
+CONNECTION_LIFETIME_BUCKETS = (1.0, 10.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 7200.0, 21600.0, 86400.0)
+
+
+class PoolStats:
+    """Metrics collected for a single connection pool and the queries run on its connections."""
+
+    def __init__(self, name: str) -> None:
+        self.wait = Histogram(
+            f'db_pool_{name}_wait_seconds',
+            'Time to check out a connection from the pool, including connecting',
+        )
+        self.connection_lifetime = Histogram(
+            f'db_pool_{name}_connection_lifetime_seconds',
+            'Lifetime of closed database connections',
+            buckets=CONNECTION_LIFETIME_BUCKETS,
+        )
+        self.timeouts = Counter(
+            f'db_pool_{name}_timeouts_total',
+            'Checkouts that gave up after the pool timeout',
+        )
+        self.query_duration = Histogram(
+            f'db_{name}_query_duration_seconds',
+            'Time to run a database query',
+        )
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long checkouts wait."""
+
+    stats: PoolStats | None = None
+
+    def connect(self) -> PoolProxiedConnection:
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            if self.stats:
+                self.stats.timeouts.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            record_pool_wait(elapsed)
+            if self.stats:
+                self.stats.wait.observe(elapsed)
+
+    def recreate(self) -> 'InstrumentedAsyncAdaptedQueuePool':
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> PoolStats:
+    """
+    Attaches pool and query metrics to an engine created with InstrumentedAsyncAdaptedQueuePool.
+
+    Returns:
+        PoolStats: The metrics of the engine's pool.
+    """
+
+    stats = PoolStats(name)
+    pool = engine.sync_engine.pool
+    pool.stats = stats
+
+    @event.listens_for(pool, 'connect')
+    def on_connect(_dbapi_connection, connection_record: ConnectionPoolEntry) -> None:
+        connection_record.info['connected_at'] = time.monotonic()
+
+    @event.listens_for(pool, 'close')
+    def on_close(_dbapi_connection, connection_record: ConnectionPoolEntry) -> None:
+        connected_at = connection_record.info.pop('connected_at', None)
+        if connected_at is not None:
+            stats.connection_lifetime.observe(time.monotonic() - connected_at)
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, _cursor, _statement, _parameters, _context, _executemany) -> None:
+        connection.info['query_started'] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, _cursor, statement, _parameters, _context, _executemany) -> None:
+        elapsed = time.perf_counter() - connection.info.pop('query_started')
+        stats.query_duration.observe(elapsed)
+        record_query(elapsed, statement)
+
+    return stats
+
+
+def get_pool_stats(engine: AsyncEngine) -> dict:
+    """Returns the current usage and metrics of the engine's connection pool."""
+
+    pool = engine.sync_engine.pool
+    stats: PoolStats | None = getattr(pool, 'stats', None)
+
+    result = {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+    }
+    if stats:
+        result.update({
+            'wait_seconds': stats.wait.snapshot(),
+            'connection_lifetime_seconds': stats.connection_lifetime.snapshot(),
+            'timeouts': stats.timeouts.value,
+        })
+    return result
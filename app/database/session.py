@@ -1,11 +1,74 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+import itertools
+from typing import Literal
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 
 from app.config import settings
+from app.database.pool import InstrumentedAsyncAdaptedQueuePool, instrument_engine
 
 DATABASE_URL = (
     f'postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}'
     f'@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}'
 )
 
-engine = create_async_engine(DATABASE_URL)
+
+def _create_engine(url: str, name: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+            'prepared_statement_cache_size': settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        },
+    )
+    instrument_engine(engine, name)
+    return engine
+
+
+class ReplicaSelector:
+    """Picks the read replica engine for a new read-only session."""
+
+    def __init__(
+            self,
+            engines: list[AsyncEngine],
+            strategy: Literal['round_robin', 'least_connections'],
+    ) -> None:
+        self.engines = engines
+        self.strategy = strategy
+        self._round_robin = itertools.cycle(engines)
+
+    def select(self) -> AsyncEngine | None:
+        if not self.engines:
+            return None
+        if self.strategy == 'least_connections':
+            return min(self.engines, key=lambda engine: engine.sync_engine.pool.checkedout())
+        return next(self._round_robin)
+
+
+engine = _create_engine(DATABASE_URL, 'primary')
+replica_engines = [
+    _create_engine(url, f'replica_{index}')
+    for index, url in enumerate(settings.DATABASE_REPLICA_URLS)
+]
+replica_selector = ReplicaSelector(replica_engines, settings.DATABASE_REPLICA_STRATEGY)
+
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+
+def ReadSessionLocal(use_primary: bool = False) -> AsyncSession:
+    """
+    Creates a session for read-only work.
+
+    The session is bound to a read replica when replicas are configured,
+    and to the primary otherwise or when `use_primary` is set.
+    """
+
+    replica = None if use_primary else replica_selector.select()
+    if replica is None:
+        return AsyncSessionLocal()
+    return AsyncSessionLocal(bind=replica)
@@ -0,0 +1,55 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.config import settings
+from app.database.crud.referral_code import (
+    get_referral_code_by_code,
+    get_referral_code_by_user_email,
+    get_referral_code_by_user_id,
+)
+from app.database.crud.user import get_user_by_email, get_user_by_id, get_users_by_referrer_id
+from app.database.session import engine, replica_engines
+
+
+async def _prepare_hot_statements(connection: AsyncConnection) -> None:
+    """
+    Runs the hot queries once with arguments that match nothing, so asyncpg
+    prepares them and keeps them in the statement cache of the connection.
+    """
+
+    async with AsyncSession(bind=connection) as db:
+        await get_user_by_id(db, 0)
+        await get_user_by_email(db, '')
+        await get_users_by_referrer_id(db, 0, settings.REFERRALS_PAGE_SIZE + 1)
+        await get_referral_code_by_code(db, '')
+        await get_referral_code_by_user_id(db, 0)
+        await get_referral_code_by_user_email(db, '')
+
+
+async def warm_up_engine(
+        async_engine: AsyncEngine,
+        size: int,
+) -> None:
+    """Opens `size` connections of the engine and prepares the hot statements on each, leaving them in the pool."""
+
+    # All connections are held at once, so the pool has to open `size` distinct ones.
+    async with AsyncExitStack() as stack:
+        connections = [await stack.enter_async_context(async_engine.connect()) for _ in range(size)]
+        async with asyncio.TaskGroup() as group:
+            for connection in connections:
+                group.create_task(_prepare_hot_statements(connection))
+
+
+async def warm_up_engines() -> None:
+    """Warms up the pools of the primary and of every read replica."""
+
+    # Connections returned to a full pool are closed, so warming more would be wasted.
+    size = min(settings.DB_POOL_WARMUP_SIZE, settings.DB_POOL_SIZE)
+    if size <= 0:
+        return
+
+    async with asyncio.TaskGroup() as group:
+        for async_engine in [engine, *replica_engines]:
+            group.create_task(warm_up_engine(async_engine, size))
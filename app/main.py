@@ -1,8 +1,68 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from app import routers
+from app.cache import cache
+from app.config import settings
+from app.middleware import RequestMetricsMiddleware
+from app.rate_limit import rate_limiter
+from app.services.leaderboard import sync_leaderboard
+from app.services.referral_code import sweep_expired_referral_codes
+from app.services.referral_code_index import sync_referral_code_index
+from app.services.referral_code_pool import refill_referral_code_pool
+from app.services.token_revocation import sync_token_denylist
+from app.services.warmup import readiness
+from app.utils.tasks import run_periodically
+from app.utils.security import shutdown_password_hashing
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await cache.start()
+    await sync_token_denylist()
+    await sync_leaderboard()
+    await refill_referral_code_pool()
+
+    background_tasks = [
+        # Requests are served while warming up; /health/ready tells the load balancer to hold them.
+        asyncio.create_task(readiness.warm_up()),
+        asyncio.create_task(run_periodically(
+            sync_token_denylist, settings.TOKEN_DENYLIST_SYNC_SECONDS, 'token denylist sync'
+        )),
+        asyncio.create_task(run_periodically(
+            sync_leaderboard, settings.LEADERBOARD_SYNC_SECONDS, 'leaderboard sync'
+        )),
+        asyncio.create_task(run_periodically(
+            refill_referral_code_pool, settings.REFERRAL_CODE_POOL_REFILL_SECONDS, 'referral code pool refill'
+        )),
+        asyncio.create_task(run_periodically(
+            sweep_expired_referral_codes, settings.REFERRAL_CODE_SWEEP_SECONDS, 'referral code expiry sweep'
+        )),
+    ]
+
+    if settings.REFERRAL_CODE_INDEX_ENABLED:
+        await sync_referral_code_index()
+        background_tasks.append(asyncio.create_task(run_periodically(
+            sync_referral_code_index, settings.REFERRAL_CODE_INDEX_SYNC_SECONDS, 'referral code index sync'
+        )))
+
+    yield
+
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+    await cache.close()
+    await rate_limiter.close()
+    shutdown_password_hashing()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(RequestMetricsMiddleware)
 
 
 @app.get('/')
@@ -16,3 +76,5 @@ async def welcome() -> dict:
 
 app.include_router(routers.auth.router)
 app.include_router(routers.referral_code.router)
+app.include_router(routers.health.router)
+app.include_router(routers.metrics.router)
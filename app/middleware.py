@@ -0,0 +1,70 @@
+import logging
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.utils.request_metrics import RequestMetrics, observe_request, start_request_metrics
+
+logger = logging.getLogger('slow_requests')
+
+
+def _server_timing(metrics: RequestMetrics, seconds: float) -> str:
+    return ', '.join([
+        f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries"',
+        f'pool;dur={metrics.pool_wait_seconds * 1000:.1f}',
+        f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+        f'hash;dur={metrics.hash_seconds * 1000:.1f}',
+        f'app;dur={seconds * 1000:.1f}',
+    ])
+
+
+def _log_slow_request(scope: Scope, metrics: RequestMetrics, seconds: float) -> None:
+    statements = ''.join(
+        f'\n  {statement_seconds * 1000:.1f} ms: {statement}'
+        for statement_seconds, statement in metrics.statements
+    )
+    logger.warning(
+        'Slow request %s %s took %.1f ms: %d queries in %.1f ms, pool wait %.1f ms, '
+        'cache %d hits %d misses, password hashing %.1f ms%s',
+        scope['method'], scope['path'], seconds * 1000, metrics.queries, metrics.db_seconds * 1000,
+        metrics.pool_wait_seconds * 1000, metrics.cache_hits, metrics.cache_misses,
+        metrics.hash_seconds * 1000, statements,
+    )
+
+
+class RequestMetricsMiddleware:
+    """
+    Collects database, cache and password hashing work done by each HTTP request.
+
+    The totals are observed in the request histograms, sent to the client in a
+    `Server-Timing` header when SERVER_TIMING_ENABLED is set, and logged along
+    with the SQL statements for requests slower than SLOW_REQUEST_SECONDS.
+    Work done after the response has started, such as streaming a body, is
+    counted in the histograms and the log but not in the header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        metrics = start_request_metrics(record_statements=settings.SLOW_REQUEST_SECONDS is not None)
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message['type'] == 'http.response.start' and settings.SERVER_TIMING_ENABLED:
+                timing = _server_timing(metrics, time.perf_counter() - started)
+                message['headers'] = [*message.get('headers', []), (b'server-timing', timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            seconds = time.perf_counter() - started
+            observe_request(metrics, seconds)
+            if settings.SLOW_REQUEST_SECONDS is not None and seconds >= settings.SLOW_REQUEST_SECONDS:
+                _log_slow_request(scope, metrics, seconds)
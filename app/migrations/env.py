@@ -10,6 +10,11 @@ from app.database import Base, DATABASE_URL
 from app.database.models import (
     User,
     ReferralCode,
+    ArchivedReferralCode,
+    RevokedToken,
+    ReferralDailyStats,
+    ReferralClosure,
+    PooledReferralCode,
 )
 
 config = context.config
@@ -0,0 +1,47 @@
+"""add referral lookup indexes
+
+Revision ID: 3b9d4f0c2a71
+Revises: e657e122b4ce
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9d4f0c2a71'
+down_revision: Union[str, None] = 'e657e122b4ce'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_referred_by_created_at_id', 'users', ['referred_by', 'created_at', 'id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            op.f('ix_referral_codes_user_id'), 'referral_codes', ['user_id'],
+            unique=True, postgresql_concurrently=True
+        )
+        op.drop_index(op.f('ix_users_id'), table_name='users', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_referral_codes_id'), table_name='referral_codes', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix_referral_codes_id'), 'referral_codes', ['id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            op.f('ix_users_id'), 'users', ['id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.drop_index(op.f('ix_referral_codes_user_id'), table_name='referral_codes', postgresql_concurrently=True)
+        op.drop_index('ix_users_referred_by_created_at_id', table_name='users', postgresql_concurrently=True)
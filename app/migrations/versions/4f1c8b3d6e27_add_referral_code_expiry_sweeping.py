@@ -0,0 +1,48 @@
+"""add referral code expiry sweeping
+
+Revision ID: 4f1c8b3d6e27
+Revises: e2b6d9a4c813
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1c8b3d6e27'
+down_revision: Union[str, None] = 'e2b6d9a4c813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('referral_codes_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('expiry_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_referral_codes_archive_code'), 'referral_codes_archive', ['code'], unique=False)
+    op.create_index(op.f('ix_referral_codes_archive_user_id'), 'referral_codes_archive', ['user_id'], unique=False)
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix_referral_codes_expiry_date'), 'referral_codes', ['expiry_date'],
+            unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_referral_codes_expiry_date'), table_name='referral_codes', postgresql_concurrently=True)
+
+    op.drop_index(op.f('ix_referral_codes_archive_user_id'), table_name='referral_codes_archive')
+    op.drop_index(op.f('ix_referral_codes_archive_code'), table_name='referral_codes_archive')
+    op.drop_table('referral_codes_archive')
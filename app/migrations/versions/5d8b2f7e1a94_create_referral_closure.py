@@ -0,0 +1,50 @@
+"""create referral closure
+
+Revision ID: 5d8b2f7e1a94
+Revises: c41a7e9b5d20
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8b2f7e1a94'
+down_revision: Union[str, None] = 'c41a7e9b5d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('referral_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['descendant_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+
+    # Backfill from the existing referrals before building the secondary indexes.
+    op.execute('''
+        INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE closure (ancestor_id, descendant_id, depth) AS (
+            SELECT referred_by, id, 1 FROM users WHERE referred_by IS NOT NULL
+            UNION ALL
+            SELECT closure.ancestor_id, users.id, closure.depth + 1
+            FROM users JOIN closure ON users.referred_by = closure.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM closure
+    ''')
+
+    op.create_index('ix_referral_closure_ancestor_id_depth_descendant_id', 'referral_closure', ['ancestor_id', 'depth', 'descendant_id'], unique=False)
+    op.create_index('ix_referral_closure_descendant_id_depth', 'referral_closure', ['descendant_id', 'depth'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_referral_closure_descendant_id_depth', table_name='referral_closure')
+    op.drop_index('ix_referral_closure_ancestor_id_depth_descendant_id', table_name='referral_closure')
+    op.drop_table('referral_closure')
@@ -0,0 +1,40 @@
+"""add referral_codes created_at
+
+Revision ID: 9d4e7b2c5a18
+Revises: 4f1c8b3d6e27
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e7b2c5a18'
+down_revision: Union[str, None] = '4f1c8b3d6e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing codes get the migration time, they are all loaded by the first full index sync anyway.
+    op.add_column('referral_codes', sa.Column(
+        'created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+    ))
+    op.alter_column('referral_codes', 'created_at', server_default=None)
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix_referral_codes_created_at'), 'referral_codes', ['created_at'],
+            unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_referral_codes_created_at'), table_name='referral_codes', postgresql_concurrently=True)
+
+    op.drop_column('referral_codes', 'created_at')
@@ -0,0 +1,32 @@
+"""add users last_referral_at index
+
+Revision ID: a7c3e5f19b42
+Revises: 5d8b2f7e1a94
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e5f19b42'
+down_revision: Union[str, None] = '5d8b2f7e1a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix_users_last_referral_at'), 'users', ['last_referral_at'],
+            unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_users_last_referral_at'), table_name='users', postgresql_concurrently=True)
@@ -0,0 +1,56 @@
+"""add referral counters
+
+Revision ID: c41a7e9b5d20
+Revises: 8f2e6a1d7c35
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41a7e9b5d20'
+down_revision: Union[str, None] = '8f2e6a1d7c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('referrals_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('last_referral_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_table('referral_daily_stats',
+    sa.Column('referrer_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['referrer_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('referrer_id', 'day')
+    )
+
+    # Backfill the counters from the existing referrals.
+    op.execute('''
+        UPDATE users
+        SET referrals_count = counts.count, last_referral_at = counts.last_referral_at
+        FROM (
+            SELECT referred_by, count(*) AS count, max(created_at) AS last_referral_at
+            FROM users
+            WHERE referred_by IS NOT NULL
+            GROUP BY referred_by
+        ) AS counts
+        WHERE users.id = counts.referred_by
+    ''')
+    op.execute('''
+        INSERT INTO referral_daily_stats (referrer_id, day, count)
+        SELECT referred_by, (created_at AT TIME ZONE 'UTC')::date, count(*)
+        FROM users
+        WHERE referred_by IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+
+
+def downgrade() -> None:
+    op.drop_table('referral_daily_stats')
+    op.drop_column('users', 'last_referral_at')
+    op.drop_column('users', 'referrals_count')
@@ -0,0 +1,29 @@
+"""create referral code pool
+
+Revision ID: e2b6d9a4c813
+Revises: a7c3e5f19b42
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b6d9a4c813'
+down_revision: Union[str, None] = 'a7c3e5f19b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('referral_code_pool',
+    sa.Column('code', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('code')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('referral_code_pool')
@@ -0,0 +1,29 @@
+from redis.asyncio import Redis
+
+from app.config import settings
+from .backends import Rate, RateLimitBackend, MemoryRateLimitBackend, RedisRateLimitBackend, parse_rate
+
+
+def create_rate_limit_backend() -> RateLimitBackend:
+    """Creates the rate limit backend selected by RATE_LIMIT_BACKEND."""
+
+    if settings.RATE_LIMIT_BACKEND == 'memory':
+        return MemoryRateLimitBackend(maxsize=settings.RATE_LIMIT_MAXSIZE)
+
+    return RedisRateLimitBackend(
+        redis=Redis.from_url(settings.REDIS_URL),
+        prefix=settings.CACHE_KEY_PREFIX + 'rate_limit:',
+    )
+
+
+rate_limiter = create_rate_limit_backend()
+
+__all__ = [
+    'Rate',
+    'RateLimitBackend',
+    'MemoryRateLimitBackend',
+    'RedisRateLimitBackend',
+    'create_rate_limit_backend',
+    'parse_rate',
+    'rate_limiter',
+]
@@ -0,0 +1,133 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+from cachetools import TLRUCache
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+
+class Rate(NamedTuple):
+    """A token bucket of `requests` tokens that refills completely every `period` seconds."""
+
+    requests: int
+    period: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.requests / self.period
+
+
+def parse_rate(rate: str) -> Rate | None:
+    """
+    Parses a rate written as `<requests>/<period>`, e.g. `10/minute`. An empty string means no limit.
+
+    Raises:
+        - ValueError: If the rate is malformed.
+    """
+
+    if not rate:
+        return None
+
+    requests, _, period = rate.partition('/')
+    if period not in PERIODS or not requests.isdigit() or int(requests) <= 0:
+        raise ValueError(f'Invalid rate {rate!r}, expected e.g. 10/minute')
+    return Rate(int(requests), PERIODS[period])
+
+
+class RateLimitBackend(ABC):
+    """Interface of a store of token buckets."""
+
+    async def close(self) -> None:
+        """Releases resources held by the backend."""
+
+    @abstractmethod
+    async def hit(self, key: str, rate: Rate) -> float:
+        """
+        Takes a token from the bucket of the key.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds until one is available.
+        """
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    In-process token buckets.
+
+    Buckets are not shared between workers, so every worker enforces the
+    full rate on its own. A bucket is forgotten once it has refilled.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._buckets = TLRUCache(maxsize=maxsize, ttu=self._full_at, timer=time.monotonic)
+
+    @staticmethod
+    def _full_at(_key: str, value: tuple[float, float, float], _now: float) -> float:
+        return value[2]
+
+    async def hit(self, key: str, rate: Rate) -> float:
+        now = time.monotonic()
+        tokens, updated_at, _ = self._buckets.get(key, (rate.requests, now, now))
+        tokens = min(rate.requests, tokens + (now - updated_at) * rate.refill_rate)
+
+        if tokens < 1:
+            return (1 - tokens) / rate.refill_rate
+
+        tokens -= 1
+        self._buckets[key] = (tokens, now, now + (rate.requests - tokens) / rate.refill_rate)
+        return 0.0
+
+
+# Takes a token from the bucket stored in the KEYS[1] hash, using the clock of the
+# Redis server so that workers with skewed clocks agree. The wait is returned as a
+# string, since Lua numbers are truncated to integers in replies.
+TOKEN_BUCKET_SCRIPT = '''
+local requests = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or requests
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(requests, tokens + math.max(0, now - updated_at) * refill_rate)
+
+if tokens < 1 then
+    return tostring((1 - tokens) / refill_rate)
+end
+
+tokens = tokens - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((requests - tokens) / refill_rate * 1000))
+return '0'
+'''
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets shared by all workers, stored in Redis.
+
+    If Redis is unavailable, requests are let through rather than failed.
+    """
+
+    def __init__(self, redis: Redis, prefix: str) -> None:
+        self.redis = redis
+        self.prefix = prefix
+        self._take_token = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+    async def hit(self, key: str, rate: Rate) -> float:
+        try:
+            retry_after = await self._take_token(keys=[self.prefix + key], args=[rate.requests, rate.refill_rate])
+        except RedisError:
+            logger.warning('Rate limit check failed, letting the request through', exc_info=True)
+            return 0.0
+        return float(retry_after)
@@ -0,0 +1,76 @@
+import math
+from typing import Annotated, Awaitable, Callable
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from app.config import settings
+from app.services.auth import get_user_id_from_token
+from app.utils.metrics import Counter
+from . import rate_limiter
+from .backends import Rate, parse_rate
+
+rate_limited_requests = Counter('rate_limited_requests_total', 'Requests rejected by a rate limit')
+
+
+async def _enforce(scope: str, key: str, rate: Rate) -> None:
+    """
+    Takes a token from the bucket of the key within the scope.
+
+    Raises:
+        - HTTPException: If the bucket is empty, raises a 429 Too Many Requests error
+                         with a Retry-After header.
+    """
+
+    retry_after = await rate_limiter.hit(f'{scope}:{key}', rate)
+    if retry_after > 0:
+        rate_limited_requests.inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Too many requests',
+            headers={'Retry-After': str(math.ceil(retry_after))},
+        )
+
+
+def _is_disabled(rate: Rate | None) -> bool:
+    return rate is None or not settings.RATE_LIMIT_ENABLED
+
+
+def limit_by_ip(scope: str, rate: str) -> Callable[..., Awaitable[None]]:
+    """Returns a dependency limiting the requests of every client IP within the scope to `rate`."""
+
+    parsed_rate = parse_rate(rate)
+
+    async def dependency(request: Request) -> None:
+        if _is_disabled(parsed_rate):
+            return
+        client_ip = request.client.host if request.client else 'unknown'
+        await _enforce(f'{scope}:ip', client_ip, parsed_rate)
+
+    return dependency
+
+
+def limit_by_login_email(scope: str, rate: str) -> Callable[..., Awaitable[None]]:
+    """Returns a dependency limiting the login attempts for every email within the scope to `rate`."""
+
+    parsed_rate = parse_rate(rate)
+
+    async def dependency(user_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> None:
+        if _is_disabled(parsed_rate):
+            return
+        await _enforce(f'{scope}:email', user_data.username.strip().lower(), parsed_rate)
+
+    return dependency
+
+
+def limit_by_user(scope: str, rate: str) -> Callable[..., Awaitable[None]]:
+    """Returns a dependency limiting the requests of every authenticated user within the scope to `rate`."""
+
+    parsed_rate = parse_rate(rate)
+
+    async def dependency(user_id: Annotated[int, Depends(get_user_id_from_token)]) -> None:
+        if _is_disabled(parsed_rate):
+            return
+        await _enforce(f'{scope}:user', str(user_id), parsed_rate)
+
+    return dependency
@@ -1,2 +1,4 @@
 from . import auth
 from . import referral_code
+from . import health
+from . import metrics
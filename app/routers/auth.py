@@ -1,21 +1,25 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database import get_db
-from app.database.crud.user import get_user_by_email, create_user, get_user_by_id
+from app.database import get_db, get_read_db
+from app.database.crud.user import get_user_by_email
+from app.rate_limit.dependencies import limit_by_ip, limit_by_login_email
 from app.schemas import UserCreateSchema, TokenResponseSchema, UserResponseSchema
 from app.services.auth import (
-    create_access_token,
-    create_refresh_token,
-    decode_token,
+    TokenClaims,
+    create_token_pair,
+    get_access_token_claims,
     get_user_id_from_token,
+    revoke_token_family,
+    rotate_refresh_token,
 )
-from app.services.user import create_user_with_referral
-from app.utils.security import verify_password
+from app.services.user import create_user_with_referral, rehash_user_password
+from app.services.user_profile import get_user_profile
+from app.utils.security import password_needs_rehash, verify_password_async
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 
@@ -25,89 +29,73 @@ router = APIRouter(prefix='/auth', tags=['auth'])
     status_code=status.HTTP_201_CREATED,
     summary='Register a new user',
     description='This endpoint registers a new user by accepting email, password and other details. '
-                'If successful, it returns an access token and a refresh token for authentication.'
+                'If successful, it returns an access token and a refresh token for authentication.',
+    dependencies=[Depends(limit_by_ip('signup', settings.RATE_LIMIT_SIGNUP_PER_IP))],
 )
 async def register_user(
         db: Annotated[AsyncSession, Depends(get_db)],
         user_create_schema: UserCreateSchema,
 ) -> TokenResponseSchema:
-    existing_user = await get_user_by_email(db, user_create_schema.email)
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='Email is already registered'
-        )
-
     user = await create_user_with_referral(db, user_create_schema)
 
-    access_token = create_access_token({'sub': str(user.id)})
-    refresh_token = create_refresh_token({'sub': str(user.id)})
-
-    return TokenResponseSchema(
-        access_token=access_token,
-        refresh_token=refresh_token,
-        token_type='bearer'
-    )
+    return create_token_pair(user.id)
 
 
 @router.post(
     '/login',
     summary='Log in a user',
     description='This endpoint allows users to authenticate by providing their email and password. '
-                'Upon successful authentication, it returns an access token and a refresh token.'
+                'Upon successful authentication, it returns an access token and a refresh token. A password '
+                'hash made with an outdated scheme or cost is replaced after the response is sent.',
+    dependencies=[
+        Depends(limit_by_ip('login', settings.RATE_LIMIT_LOGIN_PER_IP)),
+        Depends(limit_by_login_email('login', settings.RATE_LIMIT_LOGIN_PER_EMAIL)),
+    ],
 )
 async def login_user(
         db: Annotated[AsyncSession, Depends(get_db)],
-        user_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+        user_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+        background_tasks: BackgroundTasks,
 ) -> TokenResponseSchema:
     user = await get_user_by_email(db, user_data.username)
-    if not user or not verify_password(user_data.password, user.password_hash):
+    if not user or not await verify_password_async(user_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Incorrect email or password'
         )
 
-    access_token = create_access_token({'sub': str(user.id)})
-    refresh_token = create_refresh_token({'sub': str(user.id)})
+    if password_needs_rehash(user.password_hash):
+        background_tasks.add_task(rehash_user_password, user.id, user_data.password, user.password_hash)
 
-    return TokenResponseSchema(
-        access_token=access_token,
-        refresh_token=refresh_token,
-        token_type='bearer'
-    )
+    return create_token_pair(user.id)
 
 
 @router.post(
     '/refresh',
     summary='Refresh access and refresh tokens',
     description='This endpoint allows users to refresh their access and refresh tokens using a valid refresh token. '
-                'If the provided token is valid, new tokens are returned.'
+                'If the provided token is valid, new tokens are returned. Each refresh token can only be used once; '
+                'reusing one revokes all tokens issued from the same login.'
 )
-async def refresh_user_token(token: str) -> TokenResponseSchema:
-    payload = decode_token(token, settings.SECRET_KEY_REFRESH)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Invalid token',
-            headers={'WWW-Authenticate': 'Bearer'}
-        )
-
-    id_: str = payload.get('sub')
-    if id_ is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Invalid token',
-            headers={'WWW-Authenticate': 'Bearer'}
-        )
+async def refresh_user_token(
+        db: Annotated[AsyncSession, Depends(get_db)],
+        token: str,
+) -> TokenResponseSchema:
+    return await rotate_refresh_token(db, token)
 
-    access_token = create_access_token({'sub': str(id_)})
-    refresh_token = create_refresh_token({'sub': str(id_)})
 
-    return TokenResponseSchema(
-        access_token=access_token,
-        refresh_token=refresh_token,
-        token_type='bearer'
-    )
+@router.post(
+    '/logout',
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary='Log out a user',
+    description='This endpoint revokes the provided access token together with every access and refresh token '
+                'issued from the same login.'
+)
+async def logout_user(
+        db: Annotated[AsyncSession, Depends(get_db)],
+        claims: Annotated[TokenClaims, Depends(get_access_token_claims)],
+) -> None:
+    await revoke_token_family(db, claims)
 
 
 @router.get(
@@ -117,15 +105,15 @@ async def refresh_user_token(token: str) -> TokenResponseSchema:
                 'It returns the user\'s details.'
 )
 async def read_current_user(
-        db: Annotated[AsyncSession, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_read_db)],
         user_id: Annotated[int, Depends(get_user_id_from_token)],
 ) -> UserResponseSchema:
-    user = await get_user_by_id(db, user_id)
+    user = await get_user_profile(db, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='User not found'
         )
 
-    return UserResponseSchema.from_orm(user)
+    return user
 
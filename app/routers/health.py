@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, status
+
+from app.database import engine, replica_engines
+from app.database.pool import get_pool_stats
+from app.services.warmup import readiness
+
+router = APIRouter(prefix='/health', tags=['health'])
+
+
+@router.get(
+    '/pool',
+    summary='Get database connection pool statistics',
+    description='This endpoint returns the usage of the database connection pool of the current worker: '
+                'checked out connections, overflow, checkout wait time and connection lifetime histograms.'
+)
+async def read_pool_stats() -> dict:
+    stats = {'primary': get_pool_stats(engine)}
+    for index, replica_engine in enumerate(replica_engines):
+        stats[f'replica_{index}'] = get_pool_stats(replica_engine)
+    return stats
+
+
+@router.get(
+    '/ready',
+    summary='Check whether the worker is ready for traffic',
+    description='This endpoint returns 200 once the worker has opened its database connections, prepared the '
+                'hot statements and filled the referral code cache, and 503 before that.'
+)
+async def read_readiness() -> dict:
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Not ready'
+        )
+    return {'status': 'ready'}
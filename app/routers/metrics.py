@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils.metrics import render_prometheus
+
+router = APIRouter(tags=['health'])
+
+
+@router.get(
+    '/metrics',
+    response_class=PlainTextResponse,
+    summary='Get metrics in the Prometheus format',
+    description='This endpoint returns the request, database, cache and password hashing metrics '
+                'of the current worker in the Prometheus text exposition format.'
+)
+async def read_metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_prometheus(), media_type='text/plain; version=0.0.4')
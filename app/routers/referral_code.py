@@ -1,23 +1,45 @@
-from typing import Annotated, Sequence
+from typing import Annotated
 
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import EmailStr
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.cache import cache
-from app.database import get_db
-from app.database.crud.referral_code import get_referral_code_by_user_id, create_referral_code, delete_referral_code
+from app.config import settings
+from app.database import get_db, get_read_db, read_from_primary
+from app.database.crud.referral_code import get_referral_code_by_user_id, delete_referral_code
+from app.rate_limit.dependencies import limit_by_ip, limit_by_user
 from app.schemas import (
-    UserResponseSchema,
+    LeaderboardEntrySchema,
+    LeaderboardResponseSchema,
+    ReferralsPageResponseSchema,
+    ReferralStatsResponseSchema,
+    ReferralTreeNodeSchema,
+    ReferralTreePageResponseSchema,
+    ReferralTreeStatsResponseSchema,
     ReferralCodeResponseSchema,
     ReferralCodeCreateSchema,
+    ReferralCodeLookupSchema,
 )
 from app.services.auth import get_user_id_from_token
-from app.services.referral_code import get_referral_code_by_email
-from app.services.user import get_referrals_by_referrer_id
+from app.services.referral_code import (
+    get_referral_code_json_by_email,
+    get_referral_codes_by_emails,
+    create_referral_code_for_user,
+    cache_referral_code,
+    invalidate_referral_code,
+)
+from app.services.leaderboard import LeaderboardWindow, leaderboard
+from app.services.referral_code_index import referral_code_index
+from app.services.referral_tree import get_downline_page, get_downline_stats, get_upline_chain
+from app.services.user import get_referrals_page_json, get_referral_stats, stream_referrals_ndjson
+from app.utils.http import json_response
 
 router = APIRouter(tags=['referral-system'])
 
+limit_referral_code_writes = limit_by_user('referral_code', settings.RATE_LIMIT_REFERRAL_CODE_PER_USER)
+limit_lookups = limit_by_ip('lookup', settings.RATE_LIMIT_LOOKUP_PER_IP)
+
 
 @router.post(
     '/ref/create',
@@ -25,7 +47,8 @@ router = APIRouter(tags=['referral-system'])
     summary='Create a referral code',
     description='This endpoint allows an authenticated user to create a new referral code. '
                 'A user can only have one referral code at a time, and it must be created'
-                ' with an expiration date.'
+                ' with an expiration date. If `code` is omitted, the server generates one.',
+    dependencies=[Depends(limit_referral_code_writes)],
 )
 async def create_ref_code(
         db: Annotated[AsyncSession, Depends(get_db)],
@@ -39,18 +62,18 @@ async def create_ref_code(
             detail='Referral code already exists'
         )
 
-    referral_code = await create_referral_code(db, referral_code_create_schema, user_id)
+    referral_code = await create_referral_code_for_user(db, referral_code_create_schema, user_id)
+    referral_code_index.add(referral_code.code, user_id, referral_code.expiry_date)
 
-    cache[user_id] = referral_code
-
-    return ReferralCodeResponseSchema.from_orm(referral_code)
+    return await cache_referral_code(db, referral_code)
 
 
 @router.delete(
     '/ref/delete',
     summary='Delete a referral code',
     description='This endpoint allows an authenticated user to delete their referral code. '
-                'If no referral code exists for the user, a 404 error will be raised.'
+                'If no referral code exists for the user, a 404 error will be raised.',
+    dependencies=[Depends(limit_referral_code_writes)],
 )
 async def delete_ref_code(
         db: Annotated[AsyncSession, Depends(get_db)],
@@ -64,40 +87,153 @@ async def delete_ref_code(
         )
 
     await delete_referral_code(db, referral_code.id)
+    referral_code_index.discard(referral_code.code)
+
+    await invalidate_referral_code(db, user_id)
 
-    if user_id in cache:
-        del cache[user_id]
+
+@router.post(
+    '/ref/lookup',
+    summary='Get referral codes for many emails',
+    description='This endpoint allows you to retrieve the referral codes of many users at once by providing '
+                'their email addresses. It returns a map of email to referral code, with null for emails '
+                'that have no referral code.',
+    dependencies=[Depends(limit_lookups)],
+)
+async def lookup_ref_codes(
+        db: Annotated[AsyncSession, Depends(get_read_db)],
+        referral_code_lookup_schema: ReferralCodeLookupSchema,
+) -> dict[str, ReferralCodeResponseSchema | None]:
+    return await get_referral_codes_by_emails(db, referral_code_lookup_schema.emails)
 
 
 @router.get(
     '/ref/{email}',
     summary='Get referral code by email',
     description='This endpoint allows you to retrieve a referral code by providing the email address of the user. '
-                'If no referral code is found for the given email, a 404 error will be raised.'
+                'If no referral code is found for the given email, a 404 error will be raised. The response '
+                'carries an `ETag`; send it back in `If-None-Match` to get a 304 if the code has not changed.',
+    dependencies=[Depends(limit_lookups)],
 )
 async def get_ref_code_by_email(
-        db: Annotated[AsyncSession, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_read_db)],
+        request: Request,
         email: EmailStr,
 ) -> ReferralCodeResponseSchema:
-    referral_code = await get_referral_code_by_email(db, email)
+    referral_code = await get_referral_code_json_by_email(db, email)
     if not referral_code:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='Referral code not found'
         )
-    return referral_code
+    return json_response(request, referral_code)
+
+
+@router.get(
+    '/referrals/leaderboard',
+    summary='Get the top referrers',
+    description='This endpoint returns the referrers with the most referred users, best first. With '
+                '`window=recent` only referrals made during the last days (30 by default) are counted. '
+                'The ranking is kept in memory and reconciled with the database every few seconds.'
+)
+async def get_referrals_leaderboard(
+        window: LeaderboardWindow = 'all',
+        limit: Annotated[int, Query(ge=1, le=settings.LEADERBOARD_SIZE)] = settings.LEADERBOARD_SIZE,
+) -> LeaderboardResponseSchema:
+    return LeaderboardResponseSchema(
+        window=window,
+        items=[
+            LeaderboardEntrySchema(rank=rank, user_id=user_id, referrals_count=count)
+            for rank, (user_id, count) in enumerate(leaderboard.top(window, limit), start=1)
+        ],
+    )
 
 
 @router.get(
     '/referrals/{referrer_id}',
     summary='Get referrals by referrer ID',
     description='This endpoint allows you to get a list of users who were referred by a specific referrer, '
-                'identified by their referrer ID. If no referrals exist for the given referrer, an empty list'
-                ' will be returned.'
+                'identified by their referrer ID. Referrals are returned oldest first in pages of `limit` items; '
+                'pass `next_cursor` as `cursor` to get the next page. If no referrals exist for the given referrer,'
+                ' an empty list will be returned. Pages carry an `ETag`; send it back in `If-None-Match` to get '
+                'a 304 if the page has not changed. With `stream=true` all referrals starting from `cursor` are '
+                'streamed as newline-delimited JSON instead.'
 )
 async def get_referrals(
-        db: Annotated[AsyncSession, Depends(get_db)],
+        use_primary: Annotated[bool, Depends(read_from_primary)],
+        request: Request,
+        referrer_id: int,
+        limit: Annotated[int, Query(ge=1, le=settings.REFERRALS_MAX_PAGE_SIZE)] = settings.REFERRALS_PAGE_SIZE,
+        cursor: str | None = None,
+        stream: bool = False,
+) -> ReferralsPageResponseSchema:
+    if stream:
+        return StreamingResponse(
+            stream_referrals_ndjson(referrer_id, cursor, use_primary),
+            media_type='application/x-ndjson'
+        )
+
+    return json_response(request, await get_referrals_page_json(referrer_id, limit, cursor))
+
+
+@router.get(
+    '/referrals/{referrer_id}/stats',
+    summary='Get referral statistics by referrer ID',
+    description='This endpoint returns the total number of users referred by a specific referrer, the time of the '
+                'latest referral, and referral counts for the last `days` days and `weeks` weeks. '
+                'If the referrer does not exist, a 404 error will be raised.'
+)
+async def get_referrals_stats(
+        db: Annotated[AsyncSession, Depends(get_read_db)],
         referrer_id: int,
-) -> Sequence[UserResponseSchema]:
-    referrals = await get_referrals_by_referrer_id(db, referrer_id)
-    return referrals
+        days: Annotated[int, Query(ge=1, le=366)] = 30,
+        weeks: Annotated[int, Query(ge=1, le=104)] = 12,
+) -> ReferralStatsResponseSchema:
+    return await get_referral_stats(db, referrer_id, days, weeks)
+
+
+@router.get(
+    '/referrals/{user_id}/downline',
+    summary='Get the multi-level downline of a user',
+    description='This endpoint returns the users referred by a specific user, the users they referred, and so on, '
+                'down to `max_depth` levels. Every user comes with its depth, 1 being a direct referral. Users are '
+                'returned level by level in pages of `limit` items; pass `next_cursor` as `cursor` to get the '
+                'next page.'
+)
+async def get_referrals_downline(
+        db: Annotated[AsyncSession, Depends(get_read_db)],
+        user_id: int,
+        max_depth: Annotated[int, Query(ge=1, le=settings.REFERRAL_TREE_MAX_DEPTH)] = settings.REFERRAL_TREE_MAX_DEPTH,
+        limit: Annotated[int, Query(ge=1, le=settings.REFERRALS_MAX_PAGE_SIZE)] = settings.REFERRALS_PAGE_SIZE,
+        cursor: str | None = None,
+) -> ReferralTreePageResponseSchema:
+    return await get_downline_page(db, user_id, max_depth, limit, cursor)
+
+
+@router.get(
+    '/referrals/{user_id}/downline/stats',
+    summary='Get the downline size of a user',
+    description='This endpoint returns the number of users in the downline of a specific user per level, '
+                'down to `max_depth` levels, together with the total and the depth of the deepest level.'
+)
+async def get_referrals_downline_stats(
+        db: Annotated[AsyncSession, Depends(get_read_db)],
+        user_id: int,
+        max_depth: Annotated[int, Query(ge=1, le=settings.REFERRAL_TREE_MAX_DEPTH)] = settings.REFERRAL_TREE_MAX_DEPTH,
+) -> ReferralTreeStatsResponseSchema:
+    return await get_downline_stats(db, user_id, max_depth)
+
+
+@router.get(
+    '/referrals/{user_id}/upline',
+    summary='Get the upline chain of a user',
+    description='This endpoint returns the referrer of a specific user, the referrer of that referrer, and so on, '
+                'up to `max_depth` levels, nearest first. A user who signed up without a referral code has an '
+                'empty upline.'
+)
+async def get_referrals_upline(
+        db: Annotated[AsyncSession, Depends(get_read_db)],
+        user_id: int,
+        max_depth: Annotated[int, Query(ge=1, le=settings.REFERRAL_TREE_MAX_DEPTH)] = settings.REFERRAL_TREE_MAX_DEPTH,
+) -> list[ReferralTreeNodeSchema]:
+    return await get_upline_chain(db, user_id, max_depth)
@@ -1,13 +1,24 @@
 from .user import (
     UserCreateSchema,
     UserUpdateSchema,
+    UserImportSchema,
     UserResponseSchema,
+    ReferralsPageResponseSchema,
+    ReferralCountBucketSchema,
+    ReferralStatsResponseSchema,
+    ReferralTreeNodeSchema,
+    ReferralTreePageResponseSchema,
+    ReferralTreeLevelSchema,
+    ReferralTreeStatsResponseSchema,
+    LeaderboardEntrySchema,
+    LeaderboardResponseSchema,
 )
 
 from .referral_code import (
     ReferralCodeCreateSchema,
     ReferralCodeUpdateSchema,
     ReferralCodeResponseSchema,
+    ReferralCodeLookupSchema,
 )
 
 from .auth import (
@@ -17,11 +28,22 @@ from .auth import (
 __all__ = [
     'UserCreateSchema',
     'UserUpdateSchema',
+    'UserImportSchema',
     'UserResponseSchema',
+    'ReferralsPageResponseSchema',
+    'ReferralCountBucketSchema',
+    'ReferralStatsResponseSchema',
+    'ReferralTreeNodeSchema',
+    'ReferralTreePageResponseSchema',
+    'ReferralTreeLevelSchema',
+    'ReferralTreeStatsResponseSchema',
+    'LeaderboardEntrySchema',
+    'LeaderboardResponseSchema',
 
     'ReferralCodeCreateSchema',
     'ReferralCodeUpdateSchema',
     'ReferralCodeResponseSchema',
+    'ReferralCodeLookupSchema',
 
     'TokenResponseSchema',
 ]
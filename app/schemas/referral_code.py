@@ -1,10 +1,12 @@
 from datetime import datetime, timezone
 
-from pydantic import BaseModel, ConfigDict, field_validator
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
+
+REFERRAL_LOOKUP_MAX_EMAILS = 1000
 
 
 class ReferralCodeCreateSchema(BaseModel):
-    code: str
+    code: str | None = Field(None, description='Referral code, generated by the server when omitted')
     expiry_date: datetime
 
     @field_validator('expiry_date')
@@ -34,3 +36,12 @@ class ReferralCodeResponseSchema(BaseModel):
     user_id: int
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ReferralCodeLookupSchema(BaseModel):
+    emails: list[EmailStr] = Field(
+        ...,
+        min_length=1,
+        max_length=REFERRAL_LOOKUP_MAX_EMAILS,
+        description='Emails of the referrers to look up'
+    )
@@ -1,5 +1,6 @@
-from datetime import datetime
-from typing import Self
+import re
+from datetime import date, datetime
+from typing import Literal, Self
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator, model_validator, model_serializer
 
@@ -13,6 +14,9 @@ EMAIL_DESCRIPTION = 'User\'s email address, must be a valid email'
 PASSWORD_DESCRIPTION = 'User\'s password'
 PASSWORD_REPEAT_DESCRIPTION = 'Repeat password to confirm'
 REFERRAL_CODE_DESCRIPTION = 'Referral code of the referring user'
+PASSWORD_HASH_DESCRIPTION = 'Existing bcrypt hash of the user\'s password'
+
+BCRYPT_HASH_PATTERN = re.compile(r'^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$')
 
 
 class PasswordValidator:
@@ -75,9 +79,84 @@ class UserUpdateSchema(BaseModel):
         return self
 
 
+class UserImportSchema(BaseModel):
+    email: EmailStr = Field(..., description=EMAIL_DESCRIPTION)
+    password: str | None = Field(None, description=PASSWORD_DESCRIPTION)
+    password_hash: str | None = Field(None, description=PASSWORD_HASH_DESCRIPTION)
+    referral_code: str | None = Field(None, description=REFERRAL_CODE_DESCRIPTION)
+
+    @field_validator('password_hash')
+    @classmethod
+    def check_password_hash(cls, v: str | None) -> str | None:
+        if v and not BCRYPT_HASH_PATTERN.match(v):
+            raise ValueError('password_hash must be a bcrypt hash')
+        return v or None
+
+    @field_validator('password', 'referral_code')
+    @classmethod
+    def empty_to_none(cls, v: str | None) -> str | None:
+        return v or None
+
+    @model_validator(mode='after')
+    def check_password_given(self) -> Self:
+        if not self.password and not self.password_hash:
+            raise ValueError('Either password or password_hash is required')
+        return self
+
+
 class UserResponseSchema(BaseModel):
     id: int
     email: EmailStr
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ReferralsPageResponseSchema(BaseModel):
+    items: list[UserResponseSchema] = Field(..., description='Referred users, oldest first')
+    next_cursor: str | None = Field(None, description='Cursor of the next page, null on the last page')
+
+
+class ReferralCountBucketSchema(BaseModel):
+    start: date = Field(..., description='First day of the bucket (UTC)')
+    count: int = Field(..., description='Number of referrals in the bucket')
+
+
+class ReferralStatsResponseSchema(BaseModel):
+    referrer_id: int
+    total: int = Field(..., description='Total number of referred users')
+    last_referral_at: datetime | None = Field(None, description='Time of the latest referral')
+    daily: list[ReferralCountBucketSchema] = Field(..., description='Referrals per day, oldest first')
+    weekly: list[ReferralCountBucketSchema] = Field(..., description='Referrals per week starting on Monday, oldest first')
+
+
+class ReferralTreeNodeSchema(UserResponseSchema):
+    depth: int = Field(..., description='Number of referral levels between this user and the requested user')
+
+
+class ReferralTreePageResponseSchema(BaseModel):
+    items: list[ReferralTreeNodeSchema] = Field(..., description='Users ordered by depth, then by ID')
+    next_cursor: str | None = Field(None, description='Cursor of the next page, null on the last page')
+
+
+class ReferralTreeLevelSchema(BaseModel):
+    depth: int
+    count: int = Field(..., description='Number of users on this level')
+
+
+class ReferralTreeStatsResponseSchema(BaseModel):
+    user_id: int
+    total: int = Field(..., description='Number of users in the downline within the depth limit')
+    depth: int = Field(..., description='Depth of the deepest level within the depth limit')
+    levels: list[ReferralTreeLevelSchema] = Field(..., description='Number of users per level, nearest first')
+
+
+class LeaderboardEntrySchema(BaseModel):
+    rank: int
+    user_id: int
+    referrals_count: int
+
+
+class LeaderboardResponseSchema(BaseModel):
+    window: Literal['all', 'recent'] = Field(..., description='All-time or recent ranking')
+    items: list[LeaderboardEntrySchema] = Field(..., description='Referrers with the most referrals, best first')
@@ -1,23 +1,57 @@
-from typing import Annotated
+import hashlib
+import time
+import uuid
+from typing import Annotated, NamedTuple
 
 from datetime import datetime, timezone, timedelta
 
+from cachetools import TLRUCache
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
+from app.schemas import TokenResponseSchema
+from app.services.token_revocation import token_denylist, revoke_token
+from app.services.user_profile import get_user_profile
+from app.utils.metrics import Counter
+
+try:
+    # PyJWT decodes noticeably faster than python-jose and is used when installed.
+    import jwt as pyjwt
+except ImportError:
+    pyjwt = None
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/login', scheme_name='JWT')
 
 
+class TokenClaims(NamedTuple):
+    user_id: int
+    exp: float
+    jti: str | None
+    fam: str | None
+
+
+# Verified access tokens, keyed by a digest of the token and mapped to
+# their TokenClaims. Each entry is dropped once the token expires.
+_verified_tokens = TLRUCache(
+    maxsize=settings.TOKEN_CACHE_MAXSIZE,
+    ttu=lambda _key, value, _now: value.exp,
+    timer=time.time,
+)
+
+token_cache_hits = Counter('access_token_cache_hits_total', 'Access tokens found in the verified token cache')
+token_cache_misses = Counter('access_token_cache_misses_total', 'Access tokens that had to be decoded and verified')
+
+
 def _create_token(
         data: dict,
         secret_key: str,
         expires_delta: timedelta,
 ) -> str:
     """
-    Generates a JWT token.
+    Generates a JWT token with a unique `jti` claim.
 
     Args:
         - data (dict): The data to encode in the token.
@@ -33,7 +67,7 @@ def _create_token(
 
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode.update({'exp': expire})
+    to_encode.update({'exp': expire, 'jti': uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, secret_key, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
@@ -92,6 +126,33 @@ def create_refresh_token(
     )
 
 
+def create_token_pair(
+        user_id: int,
+        family: str | None = None,
+) -> TokenResponseSchema:
+    """
+    Generates an access token and a refresh token that belong to one token family.
+
+    A family starts at signup or login and is kept by every rotated refresh token,
+    so all tokens issued from one login can be revoked together.
+
+    Args:
+        - user_id (int): The ID of the user the tokens are issued to.
+        - family (str, optional): The family to continue. A new family is started if not provided.
+
+    Returns:
+        TokenResponseSchema: The generated tokens.
+    """
+
+    data = {'sub': str(user_id), 'fam': family or uuid.uuid4().hex}
+
+    return TokenResponseSchema(
+        access_token=create_access_token(data),
+        refresh_token=create_refresh_token(data),
+        token_type='bearer'
+    )
+
+
 def decode_token(token: str, key: str) -> dict | None:
     """
     Decodes a JWT token and returns the payload.
@@ -111,6 +172,9 @@ def decode_token(token: str, key: str) -> dict | None:
         decode_token("your_jwt_token", "secret_key")
     """
 
+    if pyjwt is not None:
+        return _decode_token_pyjwt(token, key)
+
     try:
         payload = jwt.decode(token, key, algorithms=[settings.ALGORITHM])
         return payload
@@ -128,38 +192,51 @@ def decode_token(token: str, key: str) -> dict | None:
         )
 
 
-async def get_user_id_from_token(token: Annotated[str, Depends(oauth2_scheme)]) -> int:
-    """
-    Retrieve the current authenticated user's ID from the provided JWT token.
+def _decode_token_pyjwt(token: str, key: str) -> dict | None:
+    try:
+        return pyjwt.decode(token, key, algorithms=[settings.ALGORITHM])
+    except pyjwt.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='Token expired',
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    except pyjwt.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Invalid token',
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
 
-    Params:
-        - token (str): The JWT token provided by the user.
-        - db (AsyncSession): The database session.
 
-    Returns:
-        - int: The current user's ID.
+def _token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _credentials_exception(detail: str = 'Could not validate user') -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={'WWW-Authenticate': 'Bearer'}
+    )
+
+
+def _claims_from_payload(payload: dict | None) -> TokenClaims:
+    """
+    Validates the claims of a decoded token.
 
     Raises:
-        - HTTPException: If the token is invalid, expired, or cannot be decoded.
+        - HTTPException: If the token has no user or expiry, or has already expired.
     """
 
-    payload = decode_token(token, settings.SECRET_KEY_ACCESS)
     if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Could not validate user',
-            headers={'WWW-Authenticate': 'Bearer'}
-        )
+        raise _credentials_exception()
 
     user_id = payload.get('sub')
     expire = payload.get('exp')
 
     if user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Could not validate user',
-            headers={'WWW-Authenticate': 'Bearer'}
-        )
+        raise _credentials_exception()
     if expire is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -176,10 +253,100 @@ async def get_user_id_from_token(token: Annotated[str, Depends(oauth2_scheme)])
     try:
         user_id = int(user_id)
     except ValueError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Could not validate user',
-            headers={'WWW-Authenticate': 'Bearer'}
-        )
+        raise _credentials_exception()
+
+    return TokenClaims(user_id=user_id, exp=expire, jti=payload.get('jti'), fam=payload.get('fam'))
+
+
+async def get_access_token_claims(token: Annotated[str, Depends(oauth2_scheme)]) -> TokenClaims:
+    """
+    Retrieve the verified claims of the provided access token.
+
+    Params:
+        - token (str): The JWT token provided by the user.
+
+    Returns:
+        - TokenClaims: The user ID, expiry, token ID and token family of the token.
+
+    Raises:
+        - HTTPException: If the token is invalid, expired, revoked, or cannot be decoded.
+
+    Tokens that were verified before are served from an in-memory cache until they expire.
+    Revocation is checked against the in-process denylist on every call.
+    """
+
+    token_digest = _token_digest(token)
+    claims = _verified_tokens.get(token_digest)
+    if claims is not None:
+        token_cache_hits.inc()
+    else:
+        token_cache_misses.inc()
+        claims = _claims_from_payload(decode_token(token, settings.SECRET_KEY_ACCESS))
+        _verified_tokens[token_digest] = claims
+
+    if token_denylist.is_revoked(claims.jti, claims.fam):
+        raise _credentials_exception('Token revoked')
+
+    return claims
+
+
+async def get_user_id_from_token(claims: Annotated[TokenClaims, Depends(get_access_token_claims)]) -> int:
+    """
+    Retrieve the current authenticated user's ID from the provided JWT token.
+
+    Returns:
+        - int: The current user's ID.
+
+    Raises:
+        - HTTPException: If the token is invalid, expired, revoked, or cannot be decoded.
+    """
+
+    return claims.user_id
+
+
+async def rotate_refresh_token(
+        db: AsyncSession,
+        token: str,
+) -> TokenResponseSchema:
+    """
+    Exchanges a refresh token for a new token pair of the same family.
+
+    Every refresh token can be used once. Using one again means it was leaked,
+    so the whole family is revoked and the user has to log in again.
+
+    Raises:
+        - HTTPException: If the token is invalid, expired, reused, revoked,
+                         or its user no longer exists.
+    """
+
+    claims = _claims_from_payload(decode_token(token, settings.SECRET_KEY_REFRESH))
+    if claims.jti is None or claims.fam is None:
+        raise _credentials_exception('Invalid token')
+
+    if token_denylist.is_revoked(claims.fam):
+        raise _credentials_exception('Token revoked')
+
+    expires_at = datetime.fromtimestamp(claims.exp, tz=timezone.utc)
+    if not await revoke_token(db, claims.jti, expires_at, claims.user_id):
+        family_expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        await revoke_token(db, claims.fam, family_expires_at, claims.user_id)
+        raise _credentials_exception('Refresh token reuse detected')
+
+    user = await get_user_profile(db, claims.user_id)
+    if not user:
+        raise _credentials_exception()
+
+    return create_token_pair(user.id, claims.fam)
+
+
+async def revoke_token_family(
+        db: AsyncSession,
+        claims: TokenClaims,
+) -> None:
+    """Revokes every access and refresh token issued from the same login as the given token."""
 
-    return user_id
+    if claims.fam is not None:
+        expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        await revoke_token(db, claims.fam, expires_at, claims.user_id)
+    elif claims.jti is not None:
+        await revoke_token(db, claims.jti, datetime.fromtimestamp(claims.exp, tz=timezone.utc), claims.user_id)
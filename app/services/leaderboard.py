@@ -0,0 +1,196 @@
+import bisect
+import heapq
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Literal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import ReadSessionLocal
+from app.database.crud.referral_stats import get_daily_stats_since, get_referrer_totals
+from app.database.models import ReferralDailyStats
+
+LeaderboardWindow = Literal['all', 'recent']
+
+# Every this many incremental syncs the leaderboard is reloaded from scratch.
+FULL_SYNC_EVERY = 20
+
+# Incremental syncs look this far behind the previous sync, so referrals
+# committed by other workers after that sync started are not missed.
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+class Leaderboard:
+    """
+    In-process ranking of referrers by the number of users they referred.
+
+    All-time totals come from `users.referrals_count`, and totals of the last
+    `window_days` days from `referral_daily_stats`. Referrals recorded by this
+    worker are counted right away, and `sync` reconciles the totals with the
+    database, which picks up referrals recorded by other workers.
+
+    The top `size` entries of each window are kept in a sorted list. A referral
+    recorded by this worker only moves its referrer within that list, or into it
+    when the new count passes the lowest entry, so serving the leaderboard
+    neither touches the database nor ranks all referrers again. The lists are
+    rebuilt only when `load` changes totals or a day falls out of the window.
+    """
+
+    def __init__(self, window_days: int, size: int) -> None:
+        self.window_days = window_days
+        self.size = size
+        self._all_time: dict[int, int] = {}
+        self._recent: dict[int, int] = {}
+        self._days: dict[date, dict[int, int]] = defaultdict(dict)
+        # `(count, -referrer_id)` pairs of the top entries, lowest first.
+        self._top: dict[LeaderboardWindow, list[tuple[int, int]]] = {}
+        self._synced_at: datetime | None = None
+        self._syncs = 0
+
+    def _window_start(self, today: date) -> date:
+        return today - timedelta(days=self.window_days - 1)
+
+    def _roll(self, today: date) -> None:
+        """Drops the days that fell out of the window."""
+
+        window_start = self._window_start(today)
+        for day in [day for day in self._days if day < window_start]:
+            for referrer_id, count in self._days.pop(day).items():
+                self._add_recent(referrer_id, -count)
+            self._top.pop('recent', None)
+
+    def _add_recent(self, referrer_id: int, count: int) -> None:
+        total = self._recent.get(referrer_id, 0) + count
+        if total > 0:
+            self._recent[referrer_id] = total
+        else:
+            self._recent.pop(referrer_id, None)
+
+    def _set_recent(self, referrer_id: int, daily_counts: dict[date, int]) -> None:
+        """Replaces the daily counts of the referrer within the window."""
+
+        for day_counts in self._days.values():
+            day_counts.pop(referrer_id, None)
+        self._recent.pop(referrer_id, None)
+
+        for day, count in daily_counts.items():
+            self._days[day][referrer_id] = count
+            self._add_recent(referrer_id, count)
+
+    def _counts(self, window: LeaderboardWindow) -> dict[int, int]:
+        return self._all_time if window == 'all' else self._recent
+
+    def _rebuild_top(self, window: LeaderboardWindow) -> list[tuple[int, int]]:
+        top = heapq.nlargest(
+            self.size, ((count, -referrer_id) for referrer_id, count in self._counts(window).items())
+        )
+        top.reverse()
+        self._top[window] = top
+        return top
+
+    def _raise_in_top(self, window: LeaderboardWindow, referrer_id: int, previous_count: int) -> None:
+        """Moves a referrer whose count in the window went up to its place among the top entries."""
+
+        top = self._top.get(window)
+        if top is None:
+            return
+
+        previous = (previous_count, -referrer_id)
+        index = bisect.bisect_left(top, previous)
+        if index < len(top) and top[index] == previous:
+            del top[index]
+        elif len(top) >= self.size:
+            # Counts only go up here, so a referrer outside the top
+            # gets in only by passing the lowest entry.
+            if (self._counts(window)[referrer_id], -referrer_id) <= top[0]:
+                return
+            del top[0]
+
+        bisect.insort(top, (self._counts(window)[referrer_id], -referrer_id))
+
+    def record_referral(self, referrer_id: int, referred_at: datetime) -> None:
+        """Counts a referral made through this worker."""
+
+        previous_count = self._all_time.get(referrer_id, 0)
+        self._all_time[referrer_id] = previous_count + 1
+        self._raise_in_top('all', referrer_id, previous_count)
+
+        day = referred_at.astimezone(timezone.utc).date()
+        if day >= self._window_start(_utc_today()):
+            self._days[day][referrer_id] = self._days[day].get(referrer_id, 0) + 1
+            previous_count = self._recent.get(referrer_id, 0)
+            self._add_recent(referrer_id, 1)
+            self._raise_in_top('recent', referrer_id, previous_count)
+
+    def load(
+            self,
+            totals: Iterable[tuple[int, int]],
+            daily_stats: Iterable[ReferralDailyStats],
+            replace: bool = False,
+    ) -> None:
+        """
+        Sets the totals of the given referrers.
+
+        Args:
+            - totals (Iterable[tuple[int, int]]): All-time totals as `(referrer_id, count)` pairs.
+            - daily_stats (Iterable[ReferralDailyStats]): Daily counts of the same referrers within the window.
+            - replace (bool): Forget all other referrers.
+        """
+
+        if replace:
+            self._all_time.clear()
+            self._recent.clear()
+            self._days.clear()
+
+        daily_counts: dict[int, dict[date, int]] = defaultdict(dict)
+        for daily in daily_stats:
+            daily_counts[daily.referrer_id][daily.day] = daily.count
+
+        for referrer_id, total in totals:
+            self._all_time[referrer_id] = total
+            self._set_recent(referrer_id, daily_counts.get(referrer_id, {}))
+
+        self._top.clear()
+
+    def top(self, window: LeaderboardWindow, limit: int) -> list[tuple[int, int]]:
+        """Returns up to `limit` `(referrer_id, count)` pairs, highest count first and lower id first on ties."""
+
+        self._roll(_utc_today())
+
+        top = self._top.get(window)
+        if top is None:
+            top = self._rebuild_top(window)
+        return [(-negated_id, count) for count, negated_id in reversed(top[-limit:])]
+
+    async def sync(self, db: AsyncSession) -> None:
+        """Reconciles the totals with the database."""
+
+        started = datetime.now(timezone.utc)
+        window_start = self._window_start(started.date())
+
+        if self._synced_at is None or self._syncs % FULL_SYNC_EVERY == 0:
+            totals = await get_referrer_totals(db)
+            daily_stats = await get_daily_stats_since(db, window_start)
+            self.load(totals, daily_stats, replace=True)
+        else:
+            totals = await get_referrer_totals(db, self._synced_at - SYNC_OVERLAP)
+            if totals:
+                referrer_ids = [referrer_id for referrer_id, _ in totals]
+                daily_stats = await get_daily_stats_since(db, window_start, referrer_ids)
+                self.load(totals, daily_stats)
+
+        self._synced_at = started
+        self._syncs += 1
+
+
+leaderboard = Leaderboard(settings.LEADERBOARD_WINDOW_DAYS, settings.LEADERBOARD_SIZE)
+
+
+async def sync_leaderboard() -> None:
+    async with ReadSessionLocal() as db:
+        await leaderboard.sync(db)
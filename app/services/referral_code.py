@@ -1,28 +1,319 @@
+import asyncio
+from datetime import datetime, timezone
+
+import orjson
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.crud.referral_code import get_referral_code_by_user_id
-from app.database.crud.user import get_user_by_email
-from app.schemas import ReferralCodeResponseSchema
 from app.cache import cache
+from app.config import settings
+from app.database import AsyncSessionLocal, ReadSessionLocal
+from app.database.crud.referral_code import (
+    create_referral_code,
+    delete_expired_referral_codes,
+    get_referral_code_by_user_email,
+    get_referral_codes_by_user_emails,
+    get_recently_used_referral_codes,
+)
+from app.database.crud.referral_code_pool import discard_pooled_referral_code
+from app.database.models import ReferralCode
+from app.schemas import ReferralCodeCreateSchema, ReferralCodeResponseSchema
+from app.services.referral_code_index import referral_code_index
+from app.services.referral_code_pool import claim_referral_code
+from app.services.user_profile import get_user_profile
+from app.utils.request_metrics import record_cache_lookups
+
+# Cached marker for emails without a referral code (unknown user or no code).
+NOT_FOUND = b'null'
+
+_in_flight: dict[str, asyncio.Future] = {}
+
+
+def normalize_email(email: str) -> str:
+    """
+    Normalizes an email the same way EmailStr does: the domain
+    is case-insensitive, the local part is kept as is.
+    """
+
+    local_part, at, domain = email.strip().rpartition('@')
+    if not at:
+        return email.strip()
+    return f'{local_part}@{domain.lower()}'
+
+
+def _cache_key(email: str) -> str:
+    return f'referral_code:email:{normalize_email(email)}'
+
+
+def _cache_ttl(referral_code_schema: ReferralCodeResponseSchema) -> float:
+    """Returns the cache TTL of a code, so that it is not cached past its expiry date."""
+
+    expires_in = (referral_code_schema.expiry_date - datetime.now(timezone.utc)).total_seconds()
+    return min(settings.CACHE_TTL, expires_in)
+
+
+def _load_cached(cached_code: bytes) -> ReferralCodeResponseSchema | None:
+    if cached_code == NOT_FOUND:
+        return None
+
+    referral_code_schema = ReferralCodeResponseSchema.model_validate_json(cached_code)
+    # An L1 copy may outlive the TTL set for it in the shared cache by a little.
+    if referral_code_schema.expiry_date <= datetime.now(timezone.utc):
+        return None
+    return referral_code_schema
+
+
+async def create_referral_code_for_user(
+        db: AsyncSession,
+        referral_code_create_schema: ReferralCodeCreateSchema,
+        user_id: int,
+) -> ReferralCode:
+    """
+    Creates the user's referral code, taking a generated code from the pool unless the client picked one.
+
+    Pooled codes are unique by construction, so creating a code never has to retry.
+
+    Raises:
+        - HTTPException: If the client picked a code while custom codes are disabled, or the code
+                         or the user's referral code already exists, raises a 400 Bad Request error.
+                         If no generated code is available, raises a 503 Service Unavailable error.
+    """
+
+    code = referral_code_create_schema.code
+    if code is None:
+        code = await claim_referral_code(db)
+    elif not settings.REFERRAL_CODE_ALLOW_CUSTOM:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Custom referral codes are disabled'
+        )
+    else:
+        await discard_pooled_referral_code(db, code)
+
+    try:
+        return await create_referral_code(
+            db, referral_code_create_schema.model_copy(update={'code': code}), user_id
+        )
+    except IntegrityError:
+        # Another user took the code, or a concurrent request created this user's code.
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Referral code already exists'
+        )
+
+
+async def cache_referral_code(
+        db: AsyncSession,
+        referral_code: ReferralCode,
+) -> ReferralCodeResponseSchema:
+    """Stores a snapshot of the referral code under its owner's email and returns it."""
+
+    referral_code_schema = ReferralCodeResponseSchema.from_orm(referral_code)
+    user = await get_user_profile(db, referral_code.user_id)
+    if user:
+        await cache.set(
+            _cache_key(user.email),
+            referral_code_schema.model_dump_json().encode(),
+            ttl=_cache_ttl(referral_code_schema),
+        )
+    return referral_code_schema
+
+
+async def invalidate_referral_code(
+        db: AsyncSession,
+        user_id: int,
+) -> None:
+    """Removes the cached referral code of the user on every worker."""
+
+    user = await get_user_profile(db, user_id)
+    if user:
+        await cache.delete(_cache_key(user.email))
+
+
+async def _load_referral_code_by_email(
+        db: AsyncSession,
+        email: str,
+        key: str,
+) -> bytes:
+    referral_code = await get_referral_code_by_user_email(db, email)
+
+    if not referral_code:
+        await cache.set(key, NOT_FOUND, ttl=settings.CACHE_NEGATIVE_TTL)
+        return NOT_FOUND
+
+    referral_code_schema = ReferralCodeResponseSchema.from_orm(referral_code)
+    body = referral_code_schema.model_dump_json().encode()
+    await cache.set(key, body, ttl=_cache_ttl(referral_code_schema))
+    return body
+
+
+async def _get_cached_referral_code(
+        db: AsyncSession,
+        email: str,
+) -> bytes:
+    """
+    Returns the cached JSON of the user's referral code, or NOT_FOUND.
+
+    Both found and missing codes are cached, so repeated lookups do not touch
+    the database. Concurrent misses for the same email share a single query.
+    """
+
+    email = normalize_email(email)
+    key = _cache_key(email)
+
+    cached_code = await cache.get(key)
+    record_cache_lookups([cached_code])
+    if cached_code is not None:
+        return cached_code
+
+    pending = _in_flight.get(key)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            # The request that was loading the code went away, load it ourselves.
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        cached_code = await _load_referral_code_by_email(db, email, key)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as error:
+        future.set_exception(error)
+        # Waiters re-raise the error themselves; don't log it as never retrieved.
+        future.exception()
+        raise
+    else:
+        future.set_result(cached_code)
+    finally:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+    return cached_code
 
 
 async def get_referral_code_by_email(
         db: AsyncSession,
         email: str,
 ) -> ReferralCodeResponseSchema | None:
-    user = await get_user_by_email(db, email)
+    """Returns the referral code of the user with the given email."""
+
+    return _load_cached(await _get_cached_referral_code(db, email))
 
-    if not user:
+
+async def get_referral_code_json_by_email(
+        db: AsyncSession,
+        email: str,
+) -> bytes | None:
+    """
+    Returns the referral code of the user with the given email, serialized as JSON.
+
+    The cached body is returned as is, so a cache hit is not parsed and serialized
+    again. Only its expiry date is read, with orjson.
+    """
+
+    cached_code = await _get_cached_referral_code(db, email)
+    if cached_code == NOT_FOUND:
         return None
 
-    cached_code = cache.get(user.id)
-    if cached_code:
-        return cached_code
+    # An L1 copy may outlive the TTL set for it in the shared cache by a little.
+    expiry_date = datetime.fromisoformat(orjson.loads(cached_code)['expiry_date'])
+    if expiry_date <= datetime.now(timezone.utc):
+        return None
+    return cached_code
+
+
+async def _cache_referral_codes(referral_codes: dict[str, ReferralCodeResponseSchema]) -> None:
+    """Caches many referral codes at once, keyed by the normalized email of their owners."""
+
+    ttls = {email: _cache_ttl(referral_code_schema) for email, referral_code_schema in referral_codes.items()}
+    await cache.set_many({
+        _cache_key(email): referral_code_schema.model_dump_json().encode()
+        for email, referral_code_schema in referral_codes.items()
+        if ttls[email] >= settings.CACHE_TTL
+    })
+    # Codes expiring before the default TTL runs out are rare, so set them one by one.
+    for email, referral_code_schema in referral_codes.items():
+        if ttls[email] < settings.CACHE_TTL:
+            await cache.set(
+                _cache_key(email), referral_code_schema.model_dump_json().encode(), ttl=ttls[email]
+            )
+
+
+async def get_referral_codes_by_emails(
+        db: AsyncSession,
+        emails: list[str],
+) -> dict[str, ReferralCodeResponseSchema | None]:
+    """
+    Returns the referral codes of many users at once, keyed by normalized email.
+
+    All emails are looked up in the cache in one pass, and the misses are
+    resolved with a single query. Emails without a code map to None.
+    """
+
+    emails = list(dict.fromkeys(normalize_email(email) for email in emails))
+    cached_codes = await cache.get_many([_cache_key(email) for email in emails])
+    record_cache_lookups(cached_codes)
+
+    referral_codes = {}
+    missing_emails = []
+    for email, cached_code in zip(emails, cached_codes):
+        if cached_code is None:
+            missing_emails.append(email)
+        else:
+            referral_codes[email] = _load_cached(cached_code)
+
+    if missing_emails:
+        found = {
+            email: ReferralCodeResponseSchema.from_orm(referral_code)
+            for email, referral_code in await get_referral_codes_by_user_emails(db, missing_emails)
+        }
+        await _cache_referral_codes(found)
+        await cache.set_many(
+            {_cache_key(email): NOT_FOUND for email in missing_emails if email not in found},
+            ttl=settings.CACHE_NEGATIVE_TTL,
+        )
+        for email in missing_emails:
+            referral_codes[email] = found.get(email)
+
+    return {email: referral_codes[email] for email in emails}
+
+
+async def sweep_expired_referral_codes() -> None:
+    """
+    Deletes or archives expired referral codes in batches until none are left.
+
+    Cached copies need no invalidation, since they are never cached past their expiry date.
+    """
+
+    batch_size = settings.REFERRAL_CODE_SWEEP_BATCH_SIZE
+    async with AsyncSessionLocal() as db:
+        while True:
+            expired_codes = await delete_expired_referral_codes(
+                db, batch_size, archive=settings.REFERRAL_CODE_SWEEP_MODE == 'archive'
+            )
+            for code in expired_codes:
+                referral_code_index.discard(code)
+            if len(expired_codes) < batch_size:
+                break
+
+
+async def warm_up_referral_code_cache() -> None:
+    """Caches the referral codes of the CACHE_WARMUP_SIZE referrers with the latest referrals."""
 
-    referral_code = await get_referral_code_by_user_id(db, user.id)
+    if settings.CACHE_WARMUP_SIZE <= 0:
+        return
 
-    if referral_code:
-        cache[user.id] = referral_code
-        return ReferralCodeResponseSchema.from_orm(referral_code)
+    async with ReadSessionLocal() as db:
+        recently_used = await get_recently_used_referral_codes(db, settings.CACHE_WARMUP_SIZE)
 
-    return None
+    await _cache_referral_codes({
+        normalize_email(email): ReferralCodeResponseSchema.from_orm(referral_code)
+        for email, referral_code in recently_used
+    })
@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.database.crud.referral_code import get_active_referral_codes
+
+# Every this many incremental syncs the index is reloaded from scratch, which
+# drops codes deleted by other workers and codes that have expired.
+FULL_SYNC_EVERY = 150
+
+# Incremental syncs reload the codes created this long before the newest known
+# code, so codes committed after a newer one are not skipped.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class ReferralCodeIndex:
+    """
+    In-process map of active referral codes to their owner and expiry time.
+
+    Codes created or deleted through this worker are applied right away, and
+    codes created by other workers show up after the next sync. Once synced,
+    a code missing from the index is taken as unknown without a query. Codes
+    deleted by other workers stay until the next full sync, so a code found
+    in the index still has to be confirmed in the database.
+    """
+
+    def __init__(self) -> None:
+        self._codes: dict[str, tuple[int, float]] = {}
+        self._created_until: datetime | None = None
+        self._syncs = 0
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has been synced, so a miss means the code does not exist."""
+
+        return self._syncs > 0
+
+    def add(self, code: str, user_id: int, expiry_date: datetime) -> None:
+        self._codes[code] = (user_id, expiry_date.timestamp())
+
+    def discard(self, code: str) -> None:
+        self._codes.pop(code, None)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._codes
+
+    def is_expired(self, code: str) -> bool:
+        """Whether the code is known to have expired. Codes missing from the index are not."""
+
+        entry = self._codes.get(code)
+        return entry is not None and entry[1] <= time.time()
+
+    async def sync(self, db: AsyncSession) -> None:
+        """Loads codes created by other workers since the previous sync."""
+
+        full_sync = self._syncs % FULL_SYNC_EVERY == 0 or self._created_until is None
+
+        created_since = None if full_sync else self._created_until - SYNC_OVERLAP
+        referral_codes = await get_active_referral_codes(db, created_since)
+        codes = {} if full_sync else self._codes
+        for referral_code in referral_codes:
+            codes[referral_code.code] = (referral_code.user_id, referral_code.expiry_date.timestamp())
+            if self._created_until is None or referral_code.created_at > self._created_until:
+                self._created_until = referral_code.created_at
+
+        self._codes = codes
+        self._syncs += 1
+
+
+referral_code_index = ReferralCodeIndex()
+
+
+async def sync_referral_code_index() -> None:
+    async with AsyncSessionLocal() as db:
+        await referral_code_index.sync(db)
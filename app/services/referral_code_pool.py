@@ -0,0 +1,71 @@
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.database.crud.referral_code_pool import (
+    add_pooled_referral_codes,
+    claim_pooled_referral_code,
+    count_pooled_referral_codes,
+)
+from app.utils.referral_codes import generate_referral_code
+
+# Codes are generated and inserted in batches of this size, so a large
+# refill does not block the event loop for long.
+REFILL_BATCH_SIZE = 1000
+
+# Emergency refills tried when the pool is dry, before giving up. Refills only
+# come up empty when every generated code collides with an existing one.
+MAX_CLAIM_REFILLS = 3
+
+
+async def fill_referral_code_pool(
+        db: AsyncSession,
+        count: int,
+) -> int:
+    """Adds up to `count` fresh codes to the pool, committing every batch, and returns how many were added."""
+
+    added = 0
+    for batch_start in range(0, count, REFILL_BATCH_SIZE):
+        batch_size = min(REFILL_BATCH_SIZE, count - batch_start)
+        added += await add_pooled_referral_codes(db, [generate_referral_code() for _ in range(batch_size)])
+    return added
+
+
+async def claim_referral_code(db: AsyncSession) -> str:
+    """
+    Takes a code from the pool, without committing.
+
+    The pool is kept full by `refill_referral_code_pool`. If it runs dry
+    anyway, a small batch is generated on the spot and committed in a
+    separate session, so the caller's transaction is left alone.
+
+    Raises:
+        - HTTPException: If the pool stays dry after a few refills, raises a 503 Service
+                         Unavailable error.
+    """
+
+    code = await claim_pooled_referral_code(db)
+    for _ in range(MAX_CLAIM_REFILLS):
+        if code is not None:
+            return code
+        async with AsyncSessionLocal() as refill_db:
+            await fill_referral_code_pool(refill_db, min(REFILL_BATCH_SIZE, settings.REFERRAL_CODE_POOL_SIZE))
+        code = await claim_pooled_referral_code(db)
+
+    if code is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='No referral code available, please try again later',
+            headers={'Retry-After': '1'}
+        )
+    return code
+
+
+async def refill_referral_code_pool() -> None:
+    """Tops the pool up to REFERRAL_CODE_POOL_SIZE codes."""
+
+    async with AsyncSessionLocal() as db:
+        missing = settings.REFERRAL_CODE_POOL_SIZE - await count_pooled_referral_codes(db)
+        if missing > 0:
+            await fill_referral_code_pool(db, missing)
@@ -0,0 +1,112 @@
+import base64
+import binascii
+
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.crud.referral_tree import get_downline, get_downline_level_counts, get_upline
+from app.schemas import (
+    ReferralTreeNodeSchema,
+    ReferralTreePageResponseSchema,
+    ReferralTreeLevelSchema,
+    ReferralTreeStatsResponseSchema,
+)
+
+
+def encode_tree_cursor(depth: int, user_id: int) -> str:
+    """Encodes the keyset position `(depth, id)` of a downline user as an opaque cursor."""
+
+    return base64.urlsafe_b64encode(f'{depth}|{user_id}'.encode()).decode()
+
+
+def decode_tree_cursor(cursor: str) -> tuple[int, int]:
+    """
+    Decodes a cursor produced by `encode_tree_cursor`.
+
+    Raises:
+        - HTTPException: If the cursor is malformed, raises a 400 Bad Request error.
+    """
+
+    try:
+        depth, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return int(depth), int(id_)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor'
+        )
+
+
+async def get_downline_page(
+        db: AsyncSession,
+        user_id: int,
+        max_depth: int,
+        limit: int,
+        cursor: str | None = None,
+) -> ReferralTreePageResponseSchema:
+    """
+    Returns a page of users up to `max_depth` levels below the user, nearest levels first.
+
+    Args:
+        - db (AsyncSession): The database session.
+        - user_id (int): The ID of the user at the top of the downline.
+        - max_depth (int): The number of levels to descend.
+        - limit (int): The maximum number of users on the page.
+        - cursor (str | None): The `next_cursor` of the previous page.
+
+    Returns:
+        - ReferralTreePageResponseSchema: The users on the page and the cursor of the next page.
+    """
+
+    after = decode_tree_cursor(cursor) if cursor else None
+
+    # One extra row tells whether there is a next page.
+    downline = await get_downline(
+        db, user_id, max_depth, limit + 1, after,
+        use_closure=settings.REFERRAL_CLOSURE_ENABLED,
+    )
+    page = downline[:limit]
+
+    return ReferralTreePageResponseSchema(
+        items=[
+            ReferralTreeNodeSchema(id=user.id, email=user.email, created_at=user.created_at, depth=depth)
+            for user, depth in page
+        ],
+        next_cursor=encode_tree_cursor(page[-1].depth, page[-1].User.id) if len(downline) > limit else None,
+    )
+
+
+async def get_upline_chain(
+        db: AsyncSession,
+        user_id: int,
+        max_depth: int,
+) -> list[ReferralTreeNodeSchema]:
+    """Returns the referrer of the user, the referrer's referrer and so on, up to `max_depth` levels."""
+
+    upline = await get_upline(db, user_id, max_depth, use_closure=settings.REFERRAL_CLOSURE_ENABLED)
+    return [
+        ReferralTreeNodeSchema(id=user.id, email=user.email, created_at=user.created_at, depth=depth)
+        for user, depth in upline
+    ]
+
+
+async def get_downline_stats(
+        db: AsyncSession,
+        user_id: int,
+        max_depth: int,
+) -> ReferralTreeStatsResponseSchema:
+    """Returns the size of the user's downline per level, up to `max_depth` levels."""
+
+    level_counts = await get_downline_level_counts(
+        db, user_id, max_depth,
+        use_closure=settings.REFERRAL_CLOSURE_ENABLED,
+    )
+    levels = [ReferralTreeLevelSchema(depth=depth, count=count) for depth, count in level_counts]
+
+    return ReferralTreeStatsResponseSchema(
+        user_id=user_id,
+        total=sum(level.count for level in levels),
+        depth=levels[-1].depth if levels else 0,
+        levels=levels,
+    )
@@ -1,42 +1,332 @@
-from typing import Sequence
+import base64
+import binascii
+import secrets
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator
 
 from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.crud.referral_code import get_referral_code_by_user_id
-from app.database.crud.user import get_users_by_referrer_id, create_user, get_user_by_referral_code
+from app.cache import cache
+from app.config import settings
+from app.database import AsyncSessionLocal, ReadSessionLocal
+from app.database.crud.referral_code import get_referral_code_by_code
+from app.database.crud.referral_stats import get_referral_daily_stats
+from app.database.crud.user import (
+    get_user_by_id,
+    get_users_by_referrer_id,
+    stream_users_by_referrer_id,
+    create_user,
+    update_user_password_hash,
+)
 from app.database.models import User
-from app.schemas import UserResponseSchema, UserCreateSchema
+from app.schemas import (
+    UserResponseSchema,
+    UserCreateSchema,
+    ReferralsPageResponseSchema,
+    ReferralCountBucketSchema,
+    ReferralStatsResponseSchema,
+)
+from app.services.leaderboard import leaderboard
+from app.services.referral_code_index import referral_code_index
+from app.services.user_profile import cache_user_profile, invalidate_user_profile
+from app.utils.referral_codes import is_valid_referral_code
+from app.utils.request_metrics import record_cache_lookups
+from app.utils.security import hash_password_async
 
 
-async def get_referrals_by_referrer_id(
+def encode_referrals_cursor(user: User) -> str:
+    """Encodes the keyset position `(created_at, id)` of a user as an opaque cursor."""
+
+    raw = f'{user.created_at.isoformat()}|{user.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_referrals_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decodes a cursor produced by `encode_referrals_cursor`.
+
+    Raises:
+        - HTTPException: If the cursor is malformed, raises a 400 Bad Request error.
+    """
+
+    try:
+        created_at, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(id_)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor'
+        )
+
+
+async def get_referrals_page(
         db: AsyncSession,
         referrer_id: int,
-) -> Sequence[UserResponseSchema]:
-    referrals = await get_users_by_referrer_id(db, referrer_id)
-    return [UserResponseSchema.from_orm(referral) for referral in referrals]
+        limit: int,
+        cursor: str | None = None,
+) -> ReferralsPageResponseSchema:
+    after = decode_referrals_cursor(cursor) if cursor else None
+
+    # One extra row tells whether there is a next page.
+    referrals = await get_users_by_referrer_id(db, referrer_id, limit + 1, after)
+    page = referrals[:limit]
+
+    return ReferralsPageResponseSchema(
+        items=[UserResponseSchema.from_orm(referral) for referral in page],
+        next_cursor=encode_referrals_cursor(page[-1]) if len(referrals) > limit else None,
+    )
+
+
+def _referrals_generation_key(referrer_id: int) -> str:
+    return f'referrals:generation:{referrer_id}'
+
+
+async def _get_referrals_generation(referrer_id: int) -> str:
+    """
+    Returns the current generation of the referrer's referrals.
+
+    Cached pages are keyed by the generation, so replacing it invalidates
+    every cached page of the referrer at once.
+    """
+
+    key = _referrals_generation_key(referrer_id)
+    generation = await cache.get(key)
+    if generation is None:
+        generation = secrets.token_hex(8).encode()
+        await cache.set(key, generation)
+    return generation.decode()
+
+
+async def invalidate_referrals(referrer_id: int) -> None:
+    """
+    Drops the cached referral pages of the referrer.
+
+    With the `memory` cache backend only the pages cached by this worker are
+    dropped, and other workers serve theirs until they expire.
+    """
+
+    await cache.delete(_referrals_generation_key(referrer_id))
+
+
+async def get_referrals_page_json(
+        referrer_id: int,
+        limit: int,
+        cursor: str | None = None,
+) -> bytes:
+    """
+    Returns a page of referrals of the referrer, serialized as JSON.
+
+    Serialized pages are cached until the referrer gets a new referral,
+    so a cache hit is returned without a query or serialization. Pages are
+    read from the primary, as a lagging replica could have a page without the
+    new referral cached under the new generation.
+
+    Raises:
+        - HTTPException: If the cursor is malformed, raises a 400 Bad Request error.
+    """
+
+    if cursor:
+        decode_referrals_cursor(cursor)
+
+    generation = await _get_referrals_generation(referrer_id)
+    key = f'referrals:page:{referrer_id}:{generation}:{limit}:{cursor or ""}'
+
+    body = await cache.get(key)
+    record_cache_lookups([body])
+    if body is None:
+        async with AsyncSessionLocal() as db:
+            referrals_page = await get_referrals_page(db, referrer_id, limit, cursor)
+        body = referrals_page.model_dump_json().encode()
+        await cache.set(key, body)
+    return body
+
+
+def stream_referrals_ndjson(
+        referrer_id: int,
+        cursor: str | None = None,
+        use_primary: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Streams all referrals of the referrer as newline-delimited JSON.
+
+    Rows are read through a server-side cursor in batches, so memory use does not
+    depend on the number of referrals. The cursor is decoded before streaming
+    starts, so a malformed cursor still results in a 400 response. With `use_primary`
+    the rows are read from the primary instead of a replica.
+    """
+
+    after = decode_referrals_cursor(cursor) if cursor else None
+    return _stream_referrals_ndjson(referrer_id, after, use_primary)
+
+
+async def _stream_referrals_ndjson(
+        referrer_id: int,
+        after: tuple[datetime, int] | None,
+        use_primary: bool,
+) -> AsyncIterator[bytes]:
+    # The generator keeps running after the request dependencies have been
+    # closed, so it needs its own session.
+    async with ReadSessionLocal(use_primary=use_primary) as db:
+        async for batch in stream_users_by_referrer_id(db, referrer_id, after):
+            yield b''.join(
+                UserResponseSchema.from_orm(referral).model_dump_json().encode() + b'\n'
+                for referral in batch
+            )
+
+
+async def get_referral_stats(
+        db: AsyncSession,
+        referrer_id: int,
+        days: int,
+        weeks: int,
+) -> ReferralStatsResponseSchema:
+    """
+    Returns referral totals of the referrer together with daily and weekly buckets.
+
+    Totals come from counters on the referrer's row and buckets from the daily summary
+    table, so the cost depends on the number of buckets, not on the number of referrals.
+
+    Raises:
+        - HTTPException: If the referrer does not exist, raises a 404 Not Found error.
+    """
+
+    referrer = await get_user_by_id(db, referrer_id)
+    if not referrer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='User not found'
+        )
+
+    today = datetime.now(timezone.utc).date()
+    first_day = today - timedelta(days=days - 1)
+    first_week = today - timedelta(days=today.weekday()) - timedelta(weeks=weeks - 1)
+
+    daily_stats = await get_referral_daily_stats(db, referrer_id, min(first_day, first_week))
+    counts: dict[date, int] = {daily.day: daily.count for daily in daily_stats}
+
+    daily = [
+        ReferralCountBucketSchema(start=day, count=counts.get(day, 0))
+        for day in (first_day + timedelta(days=offset) for offset in range(days))
+    ]
+    weekly = [
+        ReferralCountBucketSchema(
+            start=week,
+            count=sum(counts.get(week + timedelta(days=offset), 0) for offset in range(7)),
+        )
+        for week in (first_week + timedelta(weeks=offset) for offset in range(weeks))
+    ]
+
+    return ReferralStatsResponseSchema(
+        referrer_id=referrer_id,
+        total=referrer.referrals_count,
+        last_referral_at=referrer.last_referral_at,
+        daily=daily,
+        weekly=weekly,
+    )
 
 
 async def create_user_with_referral(
         db: AsyncSession,
         user_create_schema: UserCreateSchema,
 ) -> User:
+    """
+    Registers a new user, linking them to the owner of the referral code if one is given.
+
+    Once the in-process code index has been synced, codes missing from it or known to
+    be expired are rejected without a query. Other codes are confirmed with a single
+    lookup by code, whose transaction is ended before the password is hashed, so no
+    connection is held while waiting for the hashing pool and invalid codes cost no
+    hashing. A duplicate email is detected by the unique index on insert.
+
+    Raises:
+        - HTTPException: If the referral code is unknown or expired, or the email is
+                         already registered, raises a 400 Bad Request error.
+    """
+
+    code = user_create_schema.referral_code
+    if code and not settings.REFERRAL_CODE_ALLOW_CUSTOM and not is_valid_referral_code(code):
+        # Only generated codes exist, so a code with a wrong checksum is a typo.
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid referral code'
+        )
+
+    if code and settings.REFERRAL_CODE_INDEX_ENABLED and referral_code_index.ready:
+        if code not in referral_code_index:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Invalid referral code'
+            )
+        if referral_code_index.is_expired(code):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Referral code has expired'
+            )
+
     referred_by = None
-    if user_create_schema.referral_code:
-        referring_user = await get_user_by_referral_code(db, user_create_schema.referral_code)
-        if not referring_user:
+    if code:
+        referral_code = await get_referral_code_by_code(db, code)
+        if not referral_code:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='Invalid referral code'
             )
 
-        referral_code = await get_referral_code_by_user_id(db, referring_user.id)
-        if referral_code and not referral_code.is_active():
+        if not referral_code.is_active():
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='Referral code has expired'
             )
 
-        referred_by = referring_user.id
+        referred_by = referral_code.user_id
+        # Returns the connection to the pool while the password is hashed.
+        await db.rollback()
+
+    password_hash = await hash_password_async(user_create_schema.password)
+
+    try:
+        user = await create_user(
+            db, user_create_schema, password_hash, referred_by,
+            with_closure=settings.REFERRAL_CLOSURE_ENABLED,
+        )
+    except IntegrityError:
+        # The email index is the only unique constraint on users.
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Email is already registered'
+        )
+
+    if referred_by is not None:
+        leaderboard.record_referral(referred_by, user.created_at)
+        await invalidate_referrals(referred_by)
+
+    # The client usually asks for its profile right after signing up.
+    await cache_user_profile(user)
+
+    return user
+
+
+async def rehash_user_password(
+        user_id: int,
+        password: str,
+        old_password_hash: str,
+) -> None:
+    """
+    Replaces an outdated password hash of the user with one of the current scheme and cost.
+
+    Meant to run after the login response has been sent, so the upgrade adds no
+    latency to the login. If the hashing queue is full, the hash is left as is
+    and upgraded on a later login.
+    """
+
+    try:
+        password_hash = await hash_password_async(password)
+    except HTTPException:
+        return
 
-    return await create_user(db, user_create_schema, referred_by)
+    async with AsyncSessionLocal() as db:
+        if await update_user_password_hash(db, user_id, old_password_hash, password_hash):
+            await invalidate_user_profile(user_id)
@@ -0,0 +1,48 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import cache
+from app.config import settings
+from app.database.crud.user import get_user_by_id
+from app.database.models import User
+from app.schemas import UserResponseSchema
+from app.utils.request_metrics import record_cache_lookups
+
+
+def _cache_key(user_id: int) -> str:
+    return f'user:id:{user_id}'
+
+
+async def cache_user_profile(user: User) -> UserResponseSchema:
+    """Stores a snapshot of the user's profile and returns it."""
+
+    user_schema = UserResponseSchema.from_orm(user)
+    await cache.set(_cache_key(user.id), user_schema.model_dump_json().encode(), ttl=settings.USER_CACHE_TTL)
+    return user_schema
+
+
+async def get_user_profile(
+        db: AsyncSession,
+        user_id: int,
+) -> UserResponseSchema | None:
+    """
+    Returns the profile of the user with the given ID.
+
+    Profiles are cached for USER_CACHE_TTL seconds, so authenticated reads
+    usually do not touch the database. Missing users are not cached.
+    """
+
+    cached_user = await cache.get(_cache_key(user_id))
+    record_cache_lookups([cached_user])
+    if cached_user is not None:
+        return UserResponseSchema.model_validate_json(cached_user)
+
+    user = await get_user_by_id(db, user_id)
+    if not user:
+        return None
+    return await cache_user_profile(user)
+
+
+async def invalidate_user_profile(user_id: int) -> None:
+    """Removes the cached profile of the user on every worker."""
+
+    await cache.delete(_cache_key(user_id))
@@ -0,0 +1,41 @@
+import logging
+import time
+
+from app.database.warmup import warm_up_engines
+from app.services.referral_code import warm_up_referral_code_cache
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """
+    Tells whether the worker should receive traffic.
+
+    A worker becomes ready once its warm-up has finished.
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+
+    async def warm_up(self) -> None:
+        """
+        Opens the database connections, prepares the hot statements and fills the
+        referral code cache, then marks the worker as ready.
+
+        A failed warm-up is logged, and the worker becomes ready anyway: it is only
+        slower on its first requests.
+        """
+
+        started = time.perf_counter()
+        try:
+            await warm_up_engines()
+            await warm_up_referral_code_cache()
+        except Exception:
+            logger.exception('Warm-up failed, serving traffic without it')
+        else:
+            logger.info('Warm-up finished in %.2fs', time.perf_counter() - started)
+
+        self.ready = True
+
+
+readiness = Readiness()
@@ -0,0 +1,35 @@
+import hashlib
+
+from fastapi import Request, Response, status
+
+
+def make_etag(body: bytes) -> str:
+    """Returns a strong ETag for a response body."""
+
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison, so a W/ prefix does not matter.
+    return any(
+        candidate.strip().removeprefix('W/') == etag
+        for candidate in if_none_match.split(',')
+    )
+
+
+def json_response(request: Request, body: bytes) -> Response:
+    """
+    Returns an already serialized JSON body with a strong ETag.
+
+    If the client already has this body, as told by its If-None-Match header,
+    an empty 304 Not Modified response is returned instead.
+    """
+
+    etag = make_etag(body)
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
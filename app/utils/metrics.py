@@ -0,0 +1,85 @@
+import bisect
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry: dict[str, 'Histogram | Counter'] = {}
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values, in the spirit of a Prometheus histogram.
+
+    Observations are expected to come from the event loop thread, so no locking is done.
+    """
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        registry[name] = self
+
+    def observe(self, value: float) -> None:
+        """Records a single observation."""
+
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        """Returns the current state with cumulative bucket counts."""
+
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        buckets['+Inf'] = self.count
+
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': buckets,
+        }
+
+
+class Counter:
+    """Monotonically increasing counter."""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.value = 0
+        registry[name] = self
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def snapshot(self) -> dict:
+        return {'value': self.value}
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+
+    lines = []
+    for name, metric in registry.items():
+        lines.append(f'# HELP {name} {metric.description}')
+        if isinstance(metric, Histogram):
+            lines.append(f'# TYPE {name} histogram')
+            for bound, bucket_count in metric.snapshot()['buckets'].items():
+                lines.append(f'{name}_bucket{{le="{bound}"}} {bucket_count}')
+            lines.append(f'{name}_sum {_format_value(metric.sum)}')
+            lines.append(f'{name}_count {metric.count}')
+        else:
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {_format_value(metric.value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,43 @@
+import secrets
+
+from app.config import settings
+
+
+def _checksum_char(payload: str, alphabet: str) -> str:
+    """
+    Computes the Luhn mod N check character of `payload`.
+
+    It catches every single mistyped character and nearly every swap of two
+    adjacent characters, so most typos are rejected without a database lookup.
+    """
+
+    base = len(alphabet)
+    total = 0
+    factor = 2
+    for char in reversed(payload):
+        addend = factor * alphabet.index(char)
+        total += addend // base + addend % base
+        factor = 3 - factor
+    return alphabet[-total % base]
+
+
+def generate_referral_code(
+        alphabet: str = settings.REFERRAL_CODE_ALPHABET,
+        length: int = settings.REFERRAL_CODE_LENGTH,
+) -> str:
+    """Returns a random code of `length` characters followed by a check character."""
+
+    payload = ''.join(secrets.choice(alphabet) for _ in range(length))
+    return payload + _checksum_char(payload, alphabet)
+
+
+def is_valid_referral_code(
+        code: str,
+        alphabet: str = settings.REFERRAL_CODE_ALPHABET,
+        length: int = settings.REFERRAL_CODE_LENGTH,
+) -> bool:
+    """Checks the length, the characters and the check character of a generated code."""
+
+    if len(code) != length + 1 or any(char not in alphabet for char in code):
+        return False
+    return _checksum_char(code[:-1], alphabet) == code[-1]
@@ -0,0 +1,97 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from app.utils.metrics import Counter, Histogram
+
+# Statements kept for the slow request log, so a request running thousands
+# of queries does not hold all of them in memory.
+MAX_RECORDED_STATEMENTS = 100
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+cache_hits = Counter('cache_hits_total', 'Cache lookups that found a value')
+cache_misses = Counter('cache_misses_total', 'Cache lookups that found nothing')
+
+
+@dataclass
+class RequestMetrics:
+    """Work done while handling a single request."""
+
+    record_statements: bool = False
+    queries: int = 0
+    db_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    hash_seconds: float = 0.0
+    statements: list[tuple[float, str]] = field(default_factory=list)
+
+
+_current: ContextVar[RequestMetrics | None] = ContextVar('request_metrics', default=None)
+
+
+def start_request_metrics(record_statements: bool = False) -> RequestMetrics:
+    """Starts collecting metrics for the current request, which is a separate context in every task."""
+
+    metrics = RequestMetrics(record_statements=record_statements)
+    _current.set(metrics)
+    return metrics
+
+
+def record_query(seconds: float, statement: str) -> None:
+    metrics = _current.get()
+    if metrics is None:
+        return
+    metrics.queries += 1
+    metrics.db_seconds += seconds
+    if metrics.record_statements and len(metrics.statements) < MAX_RECORDED_STATEMENTS:
+        metrics.statements.append((seconds, statement))
+
+
+def record_pool_wait(seconds: float) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.pool_wait_seconds += seconds
+
+
+def record_cache_lookups(values: list[bytes | None]) -> None:
+    hits = sum(value is not None for value in values)
+    misses = len(values) - hits
+    cache_hits.inc(hits)
+    cache_misses.inc(misses)
+
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def record_hash(seconds: float) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.hash_seconds += seconds
+
+
+request_duration = Histogram('http_request_duration_seconds', 'Time to handle a request')
+request_db_queries = Histogram(
+    'http_request_db_queries',
+    'Number of database queries run by a request',
+    buckets=COUNT_BUCKETS,
+)
+request_db_duration = Histogram('http_request_db_duration_seconds', 'Time a request spent running database queries')
+request_pool_wait = Histogram(
+    'http_request_db_pool_wait_seconds',
+    'Time a request spent waiting for database connections',
+)
+request_hash_duration = Histogram(
+    'http_request_password_hash_seconds',
+    'Time a request spent hashing or verifying passwords',
+)
+
+
+def observe_request(metrics: RequestMetrics, seconds: float) -> None:
+    request_duration.observe(seconds)
+    request_db_queries.observe(metrics.queries)
+    request_db_duration.observe(metrics.db_seconds)
+    request_pool_wait.observe(metrics.pool_wait_seconds)
+    request_hash_duration.observe(metrics.hash_seconds)
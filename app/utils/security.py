@@ -1,7 +1,60 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from passlib.hash import argon2
+
+from app.config import settings
+from app.utils.metrics import Counter, Histogram
+from app.utils.request_metrics import record_hash
+
+
+def create_password_context() -> CryptContext:
+    """
+    Creates the password hashing context from the PASSWORD_* settings.
+
+    `needs_update` then reports hashes of deprecated schemes as well as hashes
+    made with a different cost, so changing the cost in either direction applies
+    to existing users as they log in.
+    """
 
+    options = {}
+    if 'bcrypt' in settings.PASSWORD_HASH_SCHEMES:
+        options.update(
+            bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+        )
+    if 'argon2' in settings.PASSWORD_HASH_SCHEMES:
+        if not argon2.has_backend():
+            raise RuntimeError('argon2 password hashing needs argon2-cffi: pip install argon2-cffi')
+        options.update(
+            argon2__rounds=settings.PASSWORD_ARGON2_TIME_COST,
+            argon2__memory_cost=settings.PASSWORD_ARGON2_MEMORY_COST,
+            argon2__parallelism=settings.PASSWORD_ARGON2_PARALLELISM,
+        )
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+    return CryptContext(schemes=settings.PASSWORD_HASH_SCHEMES, deprecated='auto', **options)
+
+
+pwd_context = create_password_context()
+
+hash_queue_wait = Histogram(
+    'password_hash_queue_wait_seconds',
+    'Time a password hashing job waits for a free worker',
+)
+hash_duration = Histogram(
+    'password_hash_duration_seconds',
+    'Time spent hashing or verifying a password in a worker',
+)
+hash_rejected = Counter(
+    'password_hash_rejected_total',
+    'Password hashing jobs rejected because the queue was full',
+)
+
+_executor: Executor | None = None
+_in_flight = 0
 
 
 def hash_password(password: str) -> str:
@@ -10,3 +63,99 @@ def hash_password(password: str) -> str:
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Tells whether a hash should be replaced with one of the current scheme and cost."""
+
+    return pwd_context.needs_update(hashed_password)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """Hashes a batch of passwords, so a worker process gets one task per batch."""
+
+    return [pwd_context.hash(password) for password in passwords]
+
+
+def _timed_call(func: Callable[..., Any], *args: Any) -> tuple[Any, float, float]:
+    """
+    Runs `func` inside a worker and reports when it started and how long it took.
+
+    time.monotonic() is system-wide on Linux, so the start time is comparable
+    with the submission time even when the worker is a separate process.
+    """
+
+    started = time.monotonic()
+    result = func(*args)
+    return result, started, time.monotonic() - started
+
+
+def _get_executor() -> Executor:
+    global _executor
+
+    if _executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == 'process':
+            _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                thread_name_prefix='password-hash',
+            )
+    return _executor
+
+
+def shutdown_password_hashing() -> None:
+    """Shuts down the password hashing worker pool, if it was started."""
+
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def _run_in_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Runs a password hashing function in the worker pool.
+
+    Jobs beyond the number of workers plus PASSWORD_HASH_MAX_QUEUE are rejected
+    right away instead of piling up behind a login storm.
+
+    Raises:
+        - HTTPException: If the queue is full, raises a 503 Service Unavailable error.
+    """
+
+    global _in_flight
+
+    if _in_flight >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_MAX_QUEUE:
+        hash_rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Server is busy, please try again later',
+            headers={'Retry-After': '1'}
+        )
+
+    _in_flight += 1
+    submitted = time.monotonic()
+    try:
+        loop = asyncio.get_running_loop()
+        result, started, elapsed = await loop.run_in_executor(_get_executor(), _timed_call, func, *args)
+    finally:
+        _in_flight -= 1
+
+    hash_queue_wait.observe(max(started - submitted, 0.0))
+    hash_duration.observe(elapsed)
+    record_hash(time.monotonic() - submitted)
+    return result
+
+
+async def hash_password_async(password: str) -> str:
+    """Hashes a password in the worker pool without blocking the event loop."""
+
+    return await _run_in_pool(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifies a password in the worker pool without blocking the event loop."""
+
+    return await _run_in_pool(verify_password, plain_password, hashed_password)
@@ -0,0 +1,23 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(func: Callable[[], Awaitable[object]], interval: float, name: str) -> None:
+    """
+    Calls `func` every `interval` seconds until cancelled.
+
+    Errors are logged and do not stop the loop, so a temporary database
+    outage does not kill the background task.
+    """
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Background task %s failed', name)
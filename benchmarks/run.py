@@ -0,0 +1,406 @@
+"""
+Benchmark of the API endpoints through an in-process ASGI client.
+
+Seeds a fresh database with users arranged in referral trees, then drives
+each scenario with a fixed number of requests at the given concurrency and
+prints the results as JSON: throughput, latency percentiles, status codes,
+database queries per request and cache hit rates. Save the output of two
+commits and compare them.
+
+The database is Postgres from the usual POSTGRES_* settings, or any
+SQLAlchemy URL passed with --database-url. SQLite through aiosqlite works as
+a stand-in, but the numbers are only comparable between runs on the same
+database, and Postgres-only statements (bulk lookups, the code pool refill,
+the expiry sweeper) are not exercised by the default scenarios.
+
+All tables of the database are dropped and recreated.
+
+Usage example:
+    python -m benchmarks.run --users 10000 --requests 2000 --concurrency 50 --output results.json
+    python -m benchmarks.run --database-url sqlite+aiosqlite:///bench.db --scenarios ref_email referrals
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter as StatusCounter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+import httpx
+from sqlalchemy import DateTime, event, insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.cache import cache
+from app.config import settings
+from app.database import AsyncSessionLocal, Base, engine as primary_engine
+from app.database.models import User, ReferralCode, PooledReferralCode
+from app.main import app
+from app.services.auth import create_token_pair
+from app.services.leaderboard import sync_leaderboard
+from app.services.referral_code_index import sync_referral_code_index
+from app.utils.metrics import Counter, registry
+from app.utils.referral_codes import generate_referral_code
+from app.utils.security import hash_password
+
+PASSWORD = 'Passw0rd!'
+SEED_BATCH_SIZE = 1000
+SCENARIOS = ['signup', 'login', 'me', 'ref_email', 'ref_create', 'referrals']
+
+
+@dataclass
+class SeedData:
+    user_ids: list[int] = field(default_factory=list)
+    emails: dict[int, str] = field(default_factory=dict)
+    codes: list[str] = field(default_factory=list)
+    referrer_ids: list[int] = field(default_factory=list)
+    users_without_code: list[int] = field(default_factory=list)
+
+
+class CacheStats:
+    """Counts hits and misses of the referral code cache by wrapping its read methods."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def install(self) -> None:
+        get, get_many = cache.get, cache.get_many
+
+        async def counted_get(key: str) -> bytes | None:
+            value = await get(key)
+            self._count([value])
+            return value
+
+        async def counted_get_many(keys: list[str]) -> list[bytes | None]:
+            values = await get_many(keys)
+            self._count(values)
+            return values
+
+        cache.get, cache.get_many = counted_get, counted_get_many
+
+    def _count(self, values: list[bytes | None]) -> None:
+        for value in values:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def reset(self) -> None:
+        self.hits = self.misses = 0
+
+
+class QueryCounter:
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.count = 0
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *_args) -> None:
+        self.count += 1
+
+
+def make_loaded_datetimes_aware() -> None:
+    """
+    SQLite drops the time zone of stored datetimes, so mark the ones loaded
+    into models as UTC again, as Postgres would return them.
+    """
+
+    def mark_utc(instance, *_args) -> None:
+        for column in instance.__table__.columns:
+            value = instance.__dict__.get(column.key)
+            if isinstance(column.type, DateTime) and isinstance(value, datetime) and value.tzinfo is None:
+                instance.__dict__[column.key] = value.replace(tzinfo=timezone.utc)
+
+    event.listen(Base, 'load', mark_utc, propagate=True)
+    event.listen(Base, 'refresh', mark_utc, propagate=True)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def reset_schema(engine: AsyncEngine) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def seed(engine: AsyncEngine, users: int, branching: int, code_fraction: float, pool_size: int) -> SeedData:
+    """
+    Creates `users` users where every user but the first was referred by user
+    `(i - 2) // branching + 1`, so the referral tree is `branching` wide and
+    about log(users) deep.
+
+    All users share one password hash, so seeding does not spend minutes in bcrypt.
+    """
+
+    password_hash = hash_password(PASSWORD)
+    now = datetime.now(timezone.utc)
+    expiry_date = now + timedelta(days=365)
+    data = SeedData()
+
+    referrals_count = [0] * (users + 1)
+    for user_id in range(2, users + 1):
+        referrals_count[(user_id - 2) // branching + 1] += 1
+
+    async with AsyncSessionLocal() as db:
+        for batch_start in range(1, users + 1, SEED_BATCH_SIZE):
+            user_rows, code_rows = [], []
+            for user_id in range(batch_start, min(batch_start + SEED_BATCH_SIZE, users + 1)):
+                email = f'seed{user_id}@example.com'
+                referred_by = (user_id - 2) // branching + 1 if user_id > 1 else None
+                user_rows.append({
+                    'id': user_id,
+                    'email': email,
+                    'password_hash': password_hash,
+                    'referred_by': referred_by,
+                    'created_at': now - timedelta(seconds=users - user_id),
+                    'referrals_count': referrals_count[user_id],
+                    'last_referral_at': now if referrals_count[user_id] else None,
+                })
+                data.user_ids.append(user_id)
+                data.emails[user_id] = email
+                if referrals_count[user_id]:
+                    data.referrer_ids.append(user_id)
+
+                if random.random() < code_fraction:
+                    code = generate_referral_code()
+                    code_rows.append({'id': user_id, 'code': code, 'user_id': user_id, 'expiry_date': expiry_date})
+                    data.codes.append(code)
+                else:
+                    data.users_without_code.append(user_id)
+
+            await db.execute(insert(User), user_rows)
+            if code_rows:
+                await db.execute(insert(ReferralCode), code_rows)
+
+        if pool_size:
+            await db.execute(insert(PooledReferralCode), [{'code': generate_referral_code()} for _ in range(pool_size)])
+
+        if engine.dialect.name == 'postgresql':
+            # Rows were inserted with explicit ids, so move the sequences past them.
+            for table in ('users', 'referral_codes'):
+                await db.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT coalesce(max(id), 1) FROM {table}))"
+                ))
+
+        await db.commit()
+
+    return data
+
+
+def build_scenarios(data: SeedData, run_id: str) -> dict[str, Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]]:
+    tokens = {}
+    users_without_code = iter(data.users_without_code)
+
+    def auth_header(user_id: int) -> dict[str, str]:
+        if user_id not in tokens:
+            tokens[user_id] = create_token_pair(user_id).access_token
+        return {'Authorization': f'Bearer {tokens[user_id]}'}
+
+    async def signup(client: httpx.AsyncClient, index: int) -> httpx.Response:
+        return await client.post('/auth/signup', json={
+            'email': f'bench-{run_id}-{index}@example.com',
+            'password': PASSWORD,
+            'password_repeat': PASSWORD,
+            'referral_code': random.choice(data.codes) if data.codes else None,
+        })
+
+    async def login(client: httpx.AsyncClient, index: int) -> httpx.Response:
+        email = data.emails[random.choice(data.user_ids)]
+        return await client.post('/auth/login', data={'username': email, 'password': PASSWORD})
+
+    async def me(client: httpx.AsyncClient, index: int) -> httpx.Response:
+        return await client.get('/auth/me', headers=auth_header(random.choice(data.user_ids)))
+
+    async def ref_email(client: httpx.AsyncClient, index: int) -> httpx.Response:
+        return await client.get(f'/ref/{data.emails[random.choice(data.user_ids)]}')
+
+    async def ref_create(client: httpx.AsyncClient, index: int) -> httpx.Response:
+        # Every user can create a code once; users that already have one get a 400.
+        user_id = next(users_without_code, None) or random.choice(data.user_ids)
+        expiry_date = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+        return await client.post('/ref/create', json={'expiry_date': expiry_date}, headers=auth_header(user_id))
+
+    async def referrals(client: httpx.AsyncClient, index: int) -> httpx.Response:
+        return await client.get(f'/referrals/{random.choice(data.referrer_ids)}')
+
+    return {
+        'signup': signup,
+        'login': login,
+        'me': me,
+        'ref_email': ref_email,
+        'ref_create': ref_create,
+        'referrals': referrals,
+    }
+
+
+async def run_scenario(
+        client: httpx.AsyncClient,
+        scenario: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]],
+        requests: int,
+        concurrency: int,
+        queries: QueryCounter,
+        cache_stats: CacheStats,
+) -> dict:
+    latencies: list[float] = []
+    status_codes: StatusCounter[int] = StatusCounter()
+    errors: StatusCounter[str] = StatusCounter()
+    indexes = iter(range(requests))
+
+    counters_before = {name: metric.value for name, metric in registry.items() if isinstance(metric, Counter)}
+    queries_before = queries.count
+    cache_stats.reset()
+
+    async def worker() -> None:
+        for index in indexes:
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, index)
+                status_codes[response.status_code] += 1
+            except Exception as error:
+                # Unhandled errors in the app propagate through the ASGI transport.
+                errors[type(error).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    cache_lookups = cache_stats.hits + cache_stats.misses
+    return {
+        'requests': requests,
+        'errors': dict(errors),
+        'status_codes': {str(code): count for code, count in sorted(status_codes.items())},
+        'duration_seconds': round(duration, 3),
+        'throughput_rps': round(requests / duration, 1) if duration else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'db_queries': queries.count - queries_before,
+        'db_queries_per_request': round((queries.count - queries_before) / requests, 3),
+        'cache': {
+            'hits': cache_stats.hits,
+            'misses': cache_stats.misses,
+            'hit_rate': round(cache_stats.hits / cache_lookups, 3) if cache_lookups else None,
+        },
+        'counters': {
+            name: metric.value - counters_before[name]
+            for name, metric in registry.items()
+            if isinstance(metric, Counter) and metric.value != counters_before.get(name, 0)
+        },
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args: argparse.Namespace) -> dict:
+    if args.database_url:
+        is_sqlite = args.database_url.startswith('sqlite')
+        # SQLite allows a single writer, so let concurrent writes wait for the lock.
+        engine = create_async_engine(args.database_url, connect_args={'timeout': 60} if is_sqlite else {})
+        AsyncSessionLocal.configure(bind=engine)
+        if is_sqlite:
+            make_loaded_datetimes_aware()
+    else:
+        engine = primary_engine
+
+    random.seed(args.seed)
+    await reset_schema(engine)
+    seed_started = time.perf_counter()
+    data = await seed(engine, args.users, args.branching, args.code_fraction, args.pool_size)
+    seed_duration = time.perf_counter() - seed_started
+
+    # All requests come from one client, so per-IP rate limits would reject most of them.
+    settings.RATE_LIMIT_ENABLED = False
+
+    # The parts of the app lifespan the scenarios depend on; periodic tasks are not started.
+    await cache.start()
+    await sync_leaderboard()
+    if settings.REFERRAL_CODE_INDEX_ENABLED:
+        await sync_referral_code_index()
+
+    queries = QueryCounter(engine)
+    cache_stats = CacheStats()
+    cache_stats.install()
+
+    run_id = f'{int(time.time())}'
+    scenarios = build_scenarios(data, run_id)
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            for name in args.scenarios:
+                results[name] = await run_scenario(
+                    client, scenarios[name], args.requests, args.concurrency, queries, cache_stats
+                )
+    finally:
+        await cache.close()
+        await engine.dispose()
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'database': engine.dialect.name,
+            'users': args.users,
+            'branching': args.branching,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed_seconds': round(seed_duration, 3),
+            'settings': {
+                'CACHE_BACKEND': settings.CACHE_BACKEND,
+                'PASSWORD_HASH_EXECUTOR': settings.PASSWORD_HASH_EXECUTOR,
+                'PASSWORD_HASH_WORKERS': settings.PASSWORD_HASH_WORKERS,
+                'DB_POOL_SIZE': settings.DB_POOL_SIZE,
+                'REFERRAL_CODE_INDEX_ENABLED': settings.REFERRAL_CODE_INDEX_ENABLED,
+                'RATE_LIMIT_ENABLED': settings.RATE_LIMIT_ENABLED,
+            },
+        },
+        'scenarios': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the API endpoints.')
+    parser.add_argument('--database-url', help='SQLAlchemy URL of the database, defaults to the POSTGRES_* settings')
+    parser.add_argument('--users', type=int, default=10000, help='Number of users to seed')
+    parser.add_argument('--branching', type=int, default=5, help='Number of users referred by every referrer')
+    parser.add_argument('--code-fraction', type=float, default=0.5, help='Share of seeded users with a referral code')
+    parser.add_argument('--pool-size', type=int, default=10000, help='Number of pre-generated codes in the pool')
+    parser.add_argument('--requests', type=int, default=1000, help='Number of requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=20, help='Number of concurrent clients')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS, help='Scenarios to run')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output', help='File to write the results to, printed to stdout by default')
+    args = parser.parse_args()
+
+    results = json.dumps(asyncio.run(benchmark(args)), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+#!/usr/bin/env bash
+
+# Script to bulk import users from a CSV or NDJSON file in Docker for development
+# The file path must be reachable from inside the web container.
+# Usage example:
+# ./scripts/dev/import_users.sh app/users.csv --resume
+
+if [ -z "$1" ]; then
+  echo "Error: Please provide the file to import"
+  echo "Usage example: ./scripts/dev/import_users.sh app/users.csv --resume"
+  exit 1
+fi
+
+if docker-compose -f ./docker/dev/docker-compose.yml exec web python -m app.cli.import_users "$@"; then
+  echo "Users imported successfully"
+else
+  echo "Error: failed to import users"
+  exit 1
+fi
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+# Settings are read on import, so these have to be set before the app is imported.
+for name, value in {
+    'POSTGRES_USER': 'test',
+    'POSTGRES_PASSWORD': 'test',
+    'POSTGRES_DB': 'test',
+    'POSTGRES_HOST': 'localhost',
+    'POSTGRES_PORT': '5432',
+    'SECRET_KEY_ACCESS': 'test-access',
+    'SECRET_KEY_REFRESH': 'test-refresh',
+    'CACHE_BACKEND': 'memory',
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return 'asyncio'
@@ -0,0 +1,43 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.services.leaderboard import Leaderboard
+
+
+def _ranked(counts: dict[int, int], limit: int) -> list[tuple[int, int]]:
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def test_recorded_referrals_keep_the_top_entries_ranked() -> None:
+    leaderboard = Leaderboard(window_days=30, size=5)
+    now = datetime.now(timezone.utc)
+    all_time: dict[int, int] = {}
+    recent: dict[int, int] = {}
+    rng = random.Random(0)
+
+    # Rank once, so the referrals below update the kept top entries in place.
+    assert leaderboard.top('all', 5) == []
+    assert leaderboard.top('recent', 5) == []
+
+    for _ in range(2000):
+        referrer_id = rng.randint(1, 40)
+        days_ago = rng.choice([0, 1, 45])
+        leaderboard.record_referral(referrer_id, now - timedelta(days=days_ago))
+
+        all_time[referrer_id] = all_time.get(referrer_id, 0) + 1
+        if days_ago < 30:
+            recent[referrer_id] = recent.get(referrer_id, 0) + 1
+
+        assert leaderboard.top('all', 5) == _ranked(all_time, 5)
+        assert leaderboard.top('recent', 3) == _ranked(recent, 3)
+
+
+def test_ties_rank_the_lower_id_first() -> None:
+    leaderboard = Leaderboard(window_days=30, size=2)
+    now = datetime.now(timezone.utc)
+    leaderboard.top('all', 2)
+
+    for referrer_id in (3, 2, 1):
+        leaderboard.record_referral(referrer_id, now)
+
+    assert leaderboard.top('all', 2) == [(1, 1), (2, 1)]
@@ -0,0 +1,171 @@
+from pathlib import Path
+from typing import Annotated, AsyncIterator
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from jose import jwt
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.cache import cache
+from app.database import AsyncSessionLocal, Base, ReadSessionLocal, get_db, get_read_db
+from app.database import depends, session
+from app.database.models import User
+from app.database.session import ReplicaSelector
+from app.services.user import get_referrals_page_json, invalidate_referrals, stream_referrals_ndjson
+
+pytestmark = pytest.mark.anyio
+
+
+async def _create_database(path: Path, name: str) -> AsyncEngine:
+    """Creates an SQLite stand-in for a Postgres server, with the schema and a row naming it."""
+
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}', poolclass=AsyncAdaptedQueuePool)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(text('CREATE TABLE server (name TEXT)'))
+        await connection.execute(text('INSERT INTO server (name) VALUES (:name)'), {'name': name})
+    return engine
+
+
+@pytest.fixture
+async def databases(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> AsyncIterator[tuple[AsyncEngine, AsyncEngine]]:
+    primary = await _create_database(tmp_path / 'primary.db', 'primary')
+    replica = await _create_database(tmp_path / 'replica.db', 'replica')
+
+    monkeypatch.setitem(AsyncSessionLocal.kw, 'bind', primary)
+    monkeypatch.setattr(session, 'replica_selector', ReplicaSelector([replica], 'round_robin'))
+    monkeypatch.setattr(depends, 'replica_engines', [replica])
+    await cache.clear()
+
+    yield primary, replica
+
+    await cache.clear()
+    await primary.dispose()
+    await replica.dispose()
+
+
+async def _server_name(db: AsyncSession) -> str:
+    return await db.scalar(text('SELECT name FROM server'))
+
+
+def _auth_header(user_id: int) -> dict[str, str]:
+    return {'Authorization': 'Bearer ' + jwt.encode({'sub': str(user_id)}, 'test-access')}
+
+
+def _create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post('/write')
+    async def write(db: Annotated[AsyncSession, Depends(get_db)]) -> None:
+        await db.execute(text("INSERT INTO server (name) VALUES ('written')"))
+        await db.commit()
+
+    @app.get('/read')
+    async def read(db: Annotated[AsyncSession, Depends(get_read_db)]) -> str:
+        return await _server_name(db)
+
+    return app
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=_create_app()), base_url='http://test')
+
+
+async def test_round_robin_alternates_between_replicas(tmp_path: Path) -> None:
+    first = await _create_database(tmp_path / 'first.db', 'first')
+    second = await _create_database(tmp_path / 'second.db', 'second')
+
+    selector = ReplicaSelector([first, second], 'round_robin')
+
+    assert [selector.select() for _ in range(4)] == [first, second, first, second]
+    assert ReplicaSelector([], 'round_robin').select() is None
+
+    await first.dispose()
+    await second.dispose()
+
+
+async def test_least_connections_picks_the_least_busy_replica(tmp_path: Path) -> None:
+    first = await _create_database(tmp_path / 'first.db', 'first')
+    second = await _create_database(tmp_path / 'second.db', 'second')
+
+    selector = ReplicaSelector([first, second], 'least_connections')
+
+    async with first.connect():
+        assert selector.select() is second
+    async with second.connect():
+        assert selector.select() is first
+
+    await first.dispose()
+    await second.dispose()
+
+
+async def test_read_sessions_use_the_replica_unless_asked_for_the_primary(databases) -> None:
+    async with ReadSessionLocal() as db:
+        assert await _server_name(db) == 'replica'
+    async with ReadSessionLocal(use_primary=True) as db:
+        assert await _server_name(db) == 'primary'
+
+
+async def test_reads_stick_to_the_primary_after_a_write_of_the_same_user(databases) -> None:
+    async with _client() as client:
+        assert (await client.get('/read', headers=_auth_header(1))).json() == 'replica'
+
+        await client.post('/write', headers=_auth_header(1))
+        client.cookies.clear()
+
+        assert (await client.get('/read', headers=_auth_header(1))).json() == 'primary'
+        assert (await client.get('/read', headers=_auth_header(2))).json() == 'replica'
+        assert (await client.get('/read')).json() == 'replica'
+
+
+async def test_reads_stick_to_the_primary_for_clients_without_a_token(databases) -> None:
+    async with _client() as client:
+        response = await client.post('/write')
+        assert depends.PRIMARY_STICKY_COOKIE in response.cookies
+
+        assert (await client.get('/read')).json() == 'primary'
+
+        client.cookies.clear()
+        assert (await client.get('/read')).json() == 'replica'
+
+
+async def test_reads_are_not_sticky_without_replicas(databases, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(depends, 'replica_engines', [])
+
+    async with _client() as client:
+        response = await client.post('/write', headers=_auth_header(1))
+        assert depends.PRIMARY_STICKY_COOKIE not in response.cookies
+
+
+async def test_referral_stream_reads_from_the_primary_when_asked(databases) -> None:
+    async with AsyncSessionLocal() as db:
+        referrer = User(email='referrer@example.com', password_hash='x')
+        db.add(referrer)
+        await db.flush()
+        db.add(User(email='referral@example.com', password_hash='x', referred_by=referrer.id))
+        await db.commit()
+        referrer_id = referrer.id
+
+    from_replica = [line async for line in stream_referrals_ndjson(referrer_id)]
+    from_primary = [line async for line in stream_referrals_ndjson(referrer_id, use_primary=True)]
+
+    assert from_replica == []
+    assert b'referral@example.com' in b''.join(from_primary)
+
+
+async def test_cached_referral_pages_are_read_from_the_primary(databases) -> None:
+    async with AsyncSessionLocal() as db:
+        referrer = User(email='referrer@example.com', password_hash='x')
+        db.add(referrer)
+        await db.flush()
+        db.add(User(email='referral@example.com', password_hash='x', referred_by=referrer.id))
+        await db.commit()
+        referrer_id = referrer.id
+    await invalidate_referrals(referrer_id)
+
+    # The replica has not got the referral yet, the cached page must have it anyway.
+    assert b'referral@example.com' in await get_referrals_page_json(referrer_id, 10)
+    assert b'referral@example.com' in await get_referrals_page_json(referrer_id, 10)
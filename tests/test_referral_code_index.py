@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.database import AsyncSessionLocal, Base
+from app.database.models import ReferralCode, User
+from app.database.pool import InstrumentedAsyncAdaptedQueuePool, instrument_engine
+from app.schemas import UserCreateSchema
+from app.services import referral_code_index as index_module
+from app.services.referral_code_index import ReferralCodeIndex
+from app.services.user import create_user_with_referral
+from app.utils.request_metrics import start_request_metrics
+from benchmarks.run import make_loaded_datetimes_aware
+
+pytestmark = pytest.mark.anyio
+
+make_loaded_datetimes_aware()
+
+
+@pytest.fixture
+async def database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> AsyncIterator[AsyncEngine]:
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path / "db.sqlite"}',
+                                 poolclass=InstrumentedAsyncAdaptedQueuePool)
+    instrument_engine(engine, 'test')
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    monkeypatch.setitem(AsyncSessionLocal.kw, 'bind', engine)
+
+    yield engine
+
+    await engine.dispose()
+
+
+@pytest.fixture
+def index(monkeypatch: pytest.MonkeyPatch) -> ReferralCodeIndex:
+    index = ReferralCodeIndex()
+    monkeypatch.setattr(index_module, 'referral_code_index', index)
+    monkeypatch.setattr('app.services.user.referral_code_index', index)
+    return index
+
+
+async def _add_code(
+        code: str,
+        expiry_date: datetime,
+        created_at: datetime | None = None,
+        id_: int | None = None,
+) -> None:
+    async with AsyncSessionLocal() as db:
+        user = User(email=f'{code.lower()}@example.com', password_hash='x')
+        db.add(user)
+        await db.flush()
+        db.add(ReferralCode(id=id_, code=code, user_id=user.id, expiry_date=expiry_date, created_at=created_at))
+        await db.commit()
+
+
+def _signup(code: str) -> UserCreateSchema:
+    return UserCreateSchema(
+        email='new@example.com', password='Passw0rd!', password_repeat='Passw0rd!', referral_code=code
+    )
+
+
+def test_only_codes_known_to_have_expired_are_expired() -> None:
+    index = ReferralCodeIndex()
+    now = datetime.now(timezone.utc)
+    index.add('ACTIVE', 1, now + timedelta(days=1))
+    index.add('EXPIRED', 2, now - timedelta(seconds=1))
+
+    assert not index.is_expired('ACTIVE')
+    assert index.is_expired('EXPIRED')
+    assert not index.is_expired('MISSING')
+
+    index.discard('EXPIRED')
+    assert 'EXPIRED' not in index
+
+
+async def test_sync_picks_up_codes_committed_out_of_order(database, index: ReferralCodeIndex) -> None:
+    now = datetime.now(timezone.utc)
+    await _add_code('FIRST', now + timedelta(days=1), id_=10)
+    await index_module.sync_referral_code_index()
+
+    # Inserted before the newest code the index has seen, but committed after it.
+    await _add_code('LATE', now + timedelta(days=1), created_at=now - timedelta(seconds=30), id_=5)
+    await index_module.sync_referral_code_index()
+
+    assert 'FIRST' in index
+    assert 'LATE' in index
+
+
+async def test_unknown_codes_are_rejected_without_a_query(database, index: ReferralCodeIndex) -> None:
+    await _add_code('KNOWN', datetime.now(timezone.utc) + timedelta(days=1))
+    await index_module.sync_referral_code_index()
+
+    metrics = start_request_metrics()
+    async with AsyncSessionLocal() as db:
+        with pytest.raises(HTTPException) as error:
+            await create_user_with_referral(db, _signup('SCRAPED'))
+
+    assert error.value.detail == 'Invalid referral code'
+    assert metrics.queries == 0
+
+
+async def test_known_codes_are_resolved_with_one_lookup(database, index: ReferralCodeIndex) -> None:
+    await _add_code('KNOWN', datetime.now(timezone.utc) + timedelta(days=1))
+    await index_module.sync_referral_code_index()
+
+    metrics = start_request_metrics(record_statements=True)
+    async with AsyncSessionLocal() as db:
+        user = await create_user_with_referral(db, _signup('KNOWN'))
+
+    assert user.referred_by is not None
+    lookups = [statement for _, statement in metrics.statements if 'FROM referral_codes' in statement]
+    assert len(lookups) == 1
+
+
+async def test_codes_are_checked_before_hashing_without_holding_a_connection(
+        database: AsyncEngine,
+        index: ReferralCodeIndex,
+        monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    await _add_code('KNOWN', datetime.now(timezone.utc) + timedelta(days=1))
+    await _add_code('EXPIRED', datetime.now(timezone.utc) - timedelta(days=1))
+    checked_out_while_hashing = []
+
+    async def hash_password(password: str) -> str:
+        checked_out_while_hashing.append(database.sync_engine.pool.checkedout())
+        return 'hash'
+
+    monkeypatch.setattr('app.services.user.hash_password_async', hash_password)
+
+    # The index has not been synced, so both codes are looked up in the database.
+    async with AsyncSessionLocal() as db:
+        with pytest.raises(HTTPException):
+            await create_user_with_referral(db, _signup('EXPIRED'))
+        assert checked_out_while_hashing == []
+
+        await create_user_with_referral(db, _signup('KNOWN'))
+        assert checked_out_while_hashing == [0]
@@ -0,0 +1,30 @@
+import pytest
+from fastapi import HTTPException
+
+from app.services import referral_code_pool
+from app.services.referral_code_pool import MAX_CLAIM_REFILLS, claim_referral_code
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_claiming_from_a_pool_that_stays_dry_gives_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    claims = []
+    refills = []
+
+    async def claim_pooled_referral_code(_db) -> None:
+        claims.append(1)
+
+    async def fill_referral_code_pool(_db, count: int) -> int:
+        # Every generated code collided with an existing one.
+        refills.append(count)
+        return 0
+
+    monkeypatch.setattr(referral_code_pool, 'claim_pooled_referral_code', claim_pooled_referral_code)
+    monkeypatch.setattr(referral_code_pool, 'fill_referral_code_pool', fill_referral_code_pool)
+
+    with pytest.raises(HTTPException) as error:
+        await claim_referral_code(None)
+
+    assert error.value.status_code == 503
+    assert len(refills) == MAX_CLAIM_REFILLS
+    assert len(claims) == MAX_CLAIM_REFILLS + 1